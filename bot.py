@@ -1,11 +1,21 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage  # Или Redis для продакшена
-from config import BOT_TOKEN
-from database.db import init_db
+from config import BOT_TOKEN, WEBHOOK_URL, METRICS_HOST, METRICS_PORT, PROFILE_ON_START
+from database.db import init_db, close_db
+from database.fsm_storage import SQLiteStorage
+from utils.outbox import outbox
+from utils.downloads import downloads
+from utils.media_gc import media_gc
+from utils.archiver import archiver
 from handlers.user import router as user_router
 from handlers.admin import router as admin_router
+from middlewares.media_group import MediaGroupMiddleware
+from middlewares.scheduler import chat_scheduler
+from middlewares.metrics import HandlerMetricsMiddleware, TelegramMetricsMiddleware
+from utils.metrics import start_metrics_server
+from utils.profiling import profile_on_start
+from utils.webhook import run_webhook
 
 logging.basicConfig(level=logging.INFO)
 
@@ -15,14 +25,44 @@ async def main():
     if BOT_TOKEN is None:
         raise ValueError("❌ BOT_TOKEN не найден в .env!")
     bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()  # Для FSM
+    bot.session.middleware(TelegramMetricsMiddleware())
+    storage = SQLiteStorage()  # FSM-сессии переживают перезапуск
     dp = Dispatcher(storage=storage)
+    # Порядок важен: части альбома собираются до очереди чата (иначе вставали бы
+    # в очередь за первой), а ждёт конца альбома уже сама очередь — следующие
+    # сообщения чата его не обгоняют
+    dp.update.outer_middleware(MediaGroupMiddleware())
+    dp.update.outer_middleware(chat_scheduler)
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
     
     dp.include_router(user_router)
     dp.include_router(admin_router)
     
+    outbox.start(bot)
+    downloads.start()
+    media_gc.start(storage)
+    archiver.start()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    profile_task = asyncio.create_task(profile_on_start(PROFILE_ON_START)) if PROFILE_ON_START else None
+
     print("🌟 Бот запущен! Ждёт обращений...")
-    await dp.start_polling(bot)
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if profile_task is not None:
+            profile_task.cancel()
+        await outbox.stop()
+        await downloads.stop()
+        await media_gc.stop()
+        await archiver.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await storage.close()
+        await close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
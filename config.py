@@ -18,9 +18,75 @@ else:
 
 MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
 os.makedirs(MEDIA_DIR, exist_ok=True)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))  # Параллельные загрузки медиа
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "200"))  # Предел очереди загрузок
+MEDIA_GROUP_WINDOW = float(os.getenv("MEDIA_GROUP_WINDOW", "0.5"))  # Секунд ожидания частей альбома
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))  # Апдейтов разных чатов одновременно
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "20"))  # Предел очереди апдейтов одного чата
+MEDIA_GC_INTERVAL = float(os.getenv("MEDIA_GC_INTERVAL", "3600"))  # Период сборки сиротских файлов, сек
+MEDIA_GC_GRACE = float(os.getenv("MEDIA_GC_GRACE", "86400"))  # Файл без ссылок живёт не меньше, сек
 
 EXPORTS_DIR = os.path.join(os.path.dirname(__file__), "exports")
 os.makedirs(EXPORTS_DIR, exist_ok=True)
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))  # Строк за одно чтение из базы
+EXPORT_MAX_AGE_HOURS = float(os.getenv("EXPORT_MAX_AGE_HOURS", "24"))  # Старые выгрузки удаляются
+EXPORT_MAX_TOTAL_MB = float(os.getenv("EXPORT_MAX_TOTAL_MB", "200"))  # Предел размера папки exports
+
+# База данных: размер пула соединений и кэш подготовленных выражений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "128"))
+
+# Webhook-режим: включается, если задан WEBHOOK_URL (иначе long polling)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес, например https://bot.example.uz
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Обязателен в webhook-режиме: заголовок X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")  # Слушаем локально, снаружи — reverse proxy
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "50"))  # Апдейтов одновременно в процессе
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Соединений со стороны Telegram
+WEBHOOK_REPLY_TIMEOUT = float(os.getenv("WEBHOOK_REPLY_TIMEOUT", "5"))  # Сколько ждать ответ хендлера, сек
+
+# Метрики Prometheus: локальный эндпоинт http://METRICS_HOST:METRICS_PORT/metrics (0 — выключен)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Несколько экземпляров на хосте — у каждого свой порт
+
+# Профилирование (/profile и PROFILE_ON_START)
+PROFILES_DIR = os.path.join(os.path.dirname(__file__), "profiles")
+PROFILE_ON_START = float(os.getenv("PROFILE_ON_START", "0"))  # Секунд профилирования после запуска, 0 — выключено
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))  # Предел длительности /profile
+PROFILE_LAG_INTERVAL = float(os.getenv("PROFILE_LAG_INTERVAL", "0.1"))  # Период замера задержки цикла, сек
+PROFILE_SLOW_CALLBACK = float(os.getenv("PROFILE_SLOW_CALLBACK", "0.1"))  # Порог медленного колбэка asyncio, сек
+
+# Архив: обработанные обращения старше ARCHIVE_AFTER_DAYS переносятся в отдельный файл
+ARCHIVE_DB_FILE = os.getenv("ARCHIVE_DB_FILE", "archive.db")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "86400"))  # Период фонового переноса, сек
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))  # Обращений за одну транзакцию
+
+# Лимиты Telegram для исходящих сообщений
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))  # Сообщений в секунду на бота
+TG_PER_CHAT_RATE = float(os.getenv("TG_PER_CHAT_RATE", "1"))  # Сообщений в секунду в один чат
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Outbox: фоновая доставка уведомлений гражданам
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "5"))  # Секунд до первой повторной попытки
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "10"))
+
+# FSM-сессии в SQLite
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "5000"))  # Горячих сессий в памяти
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))  # Период сброса изменений, сек
+FSM_SESSION_TTL = float(os.getenv("FSM_SESSION_TTL", str(7 * 24 * 3600)))  # Брошенная сессия живёт, сек
+
+# Кэш ролей пользователей (is_admin)
+ROLE_CACHE_SIZE = int(os.getenv("ROLE_CACHE_SIZE", "10000"))
+ROLE_CACHE_TTL = int(os.getenv("ROLE_CACHE_TTL", "300"))
+# Кэш сводок обращений для /status (сбрасывается при обработке обращения)
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "2000"))
+STATUS_CACHE_TTL = int(os.getenv("STATUS_CACHE_TTL", "3600"))
 
 if not BOT_TOKEN:
     raise ValueError("❌ Добавь BOT_TOKEN в .env!")
@@ -1,134 +1,554 @@
+import asyncio
+import time
 import aiosqlite
+from contextlib import asynccontextmanager
+from typing import Callable
 from datetime import datetime
 import os
-from config import MEDIA_DIR
+import re
+from config import (MEDIA_DIR, DB_POOL_SIZE, DB_STATEMENT_CACHE, ROLE_CACHE_SIZE, ROLE_CACHE_TTL,
+                    STATUS_CACHE_SIZE, STATUS_CACHE_TTL, ARCHIVE_DB_FILE, ARCHIVE_BATCH_SIZE)
+from database.migrations import migrate, REBUILD_COUNTERS_SQL, ARCHIVE_REBUILD_COUNTERS_SQL, ARCHIVE_MIGRATIONS
+from utils.cache import TTLCache
+from utils.metrics import metrics
+from utils.validators import normalize_phone
 
 DB_FILE = "bot.db"
 
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+def _statement_label(sql: str) -> str:
+    """Нормализованный текст выражения — метка метрики.
+
+    Списки плейсхолдеров IN (?, ?, ...) сворачиваются, чтобы число серий не росло.
+    """
+    sql = _PLACEHOLDER_LIST.sub("?...", _WHITESPACE.sub(" ", sql).strip())
+    return sql[:200]
+
+class TimedConnection:
+    """Обёртка над соединением: время каждого выражения в метрике bot_db_query_seconds"""
+
+    def __init__(self, db: aiosqlite.Connection):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    async def _timed(self, sql: str, call):
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            metrics.observe("bot_db_query_seconds", time.perf_counter() - started, {"statement": _statement_label(sql)})
+
+    async def execute(self, sql: str, parameters=None) -> aiosqlite.Cursor:
+        return await self._timed(sql, self._db.execute(sql, parameters))
+
+    async def executemany(self, sql: str, parameters) -> aiosqlite.Cursor:
+        return await self._timed(sql, self._db.executemany(sql, parameters))
+
+    async def commit(self):
+        return await self._timed("COMMIT", self._db.commit())
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с SQLite (WAL, synchronous=NORMAL).
+
+    К каждому соединению подключена архивная база как schema 'archive'.
+    """
+
+    def __init__(self, path: str, archive_path: str = ARCHIVE_DB_FILE, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.archive_path = archive_path
+        self.size = max(1, size)
+        self._queue: asyncio.Queue[TimedConnection] = asyncio.Queue()
+        self._connections: list[TimedConnection] = []
+
+    async def open(self):
+        for _ in range(self.size):
+            # cached_statements — кэш подготовленных выражений sqlite3
+            db = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute("PRAGMA busy_timeout=5000")
+            await db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            await db.execute("PRAGMA archive.journal_mode=WAL")
+            await db.execute("PRAGMA archive.synchronous=NORMAL")
+            timed = TimedConnection(db)
+            self._connections.append(timed)
+            self._queue.put_nowait(timed)
+
+    async def close(self):
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+        self._queue = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self):
+        db = await self._queue.get()
+        try:
+            yield db
+        finally:
+            # Незавершённая транзакция не должна достаться следующему
+            if db.in_transaction:
+                await db.rollback()
+            self._queue.put_nowait(db)
+
+_pool: ConnectionPool | None = None
+
+def get_db():
+    """Взять соединение из пула: async with get_db() as db: ..."""
+    if _pool is None:
+        raise RuntimeError("База не инициализирована: сначала вызовите init_db()")
+    return _pool.acquire()
+
+async def close_db():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
 async def init_db():
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                telegram_id INTEGER PRIMARY KEY,
-                role TEXT DEFAULT 'user'  -- 'user' или 'admin'
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS appeals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                phone TEXT,
-                full_name TEXT,
-                address TEXT,
-                domkom TEXT,
-                text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'unprocessed',  -- 'unprocessed' или 'processed'
-                comment TEXT  -- Опциональный комментарий админа
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS media (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                appeal_id INTEGER,
-                file_path TEXT,
-                file_type TEXT  -- 'photo' или 'video'
-            )
-        ''')
-        await db.commit()
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DB_FILE)
+        await _pool.open()
+    async with get_db() as db:
+        await migrate(db)
+        await migrate(db, ARCHIVE_MIGRATIONS, schema="archive")
+
+# Кэш ролей: telegram_id -> 'admin' / 'user' / None (нет в базе).
+# Пишется насквозь из add_user/update_user_role, поэтому проверки прав
+# почти всегда обходятся без запроса к базе.
+role_cache = TTLCache(maxsize=ROLE_CACHE_SIZE, ttl=ROLE_CACHE_TTL)
+_ALL_USERS_KEY = '__all_users__'
+_NOT_CACHED = object()
+metrics.collector(lambda: {f"bot_role_cache_{key}": value for key, value in role_cache.stats().items()})
 
 async def add_user(telegram_id: int, role: str = 'user'):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
+    async with get_db() as db:
+        cursor = await db.execute(
             "INSERT OR IGNORE INTO users (telegram_id, role) VALUES (?, ?)",
             (telegram_id, role)
         )
         await db.commit()
+    if cursor.rowcount:
+        role_cache.set(telegram_id, role)
+        role_cache.invalidate(_ALL_USERS_KEY)
 
 async def update_user_role(telegram_id: int, role: str):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
+    async with get_db() as db:
+        cursor = await db.execute(
             "UPDATE users SET role = ? WHERE telegram_id = ?",
             (role, telegram_id)
         )
         await db.commit()
+    if cursor.rowcount:
+        role_cache.set(telegram_id, role)
+    else:
+        role_cache.invalidate(telegram_id)
+    role_cache.invalidate(_ALL_USERS_KEY)
 
 async def get_all_users():
-    async with aiosqlite.connect(DB_FILE) as db:
+    users = role_cache.get(_ALL_USERS_KEY, _NOT_CACHED)
+    if users is not _NOT_CACHED:
+        return list(users)
+    async with get_db() as db:
         cursor = await db.execute("SELECT telegram_id, role FROM users ORDER BY telegram_id")
-        return list(await cursor.fetchall())
+        users = list(await cursor.fetchall())
+    role_cache.set(_ALL_USERS_KEY, users)
+    return list(users)
 
 async def is_admin(telegram_id: int) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT role FROM users WHERE telegram_id = ?", (telegram_id,))
-        row = await cursor.fetchone()
-        return row is not None and row[0] == 'admin'
+    role = role_cache.get(telegram_id, _NOT_CACHED)
+    if role is _NOT_CACHED:
+        async with get_db() as db:
+            cursor = await db.execute("SELECT role FROM users WHERE telegram_id = ?", (telegram_id,))
+            row = await cursor.fetchone()
+        role = row[0] if row else None
+        role_cache.set(telegram_id, role)
+    return role == 'admin'
 
-async def create_appeal(data: dict) -> int:
-    async with aiosqlite.connect(DB_FILE) as db:
+async def submit_appeal(data: dict, media: list[dict]) -> int:
+    """Записать обращение и все его медиа одной транзакцией; вернуть id"""
+    async with get_db() as db:
         cursor = await db.execute(
-            """INSERT INTO appeals (user_id, phone, full_name, address, domkom, text)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (data['user_id'], data['phone'], data['full_name'], data['address'], data['domkom'], data['text'])
+            """INSERT INTO appeals (user_id, phone, phone_norm, full_name, address, domkom, text)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (data['user_id'], data['phone'], normalize_phone(data['phone']), data['full_name'], data['address'],
+             data['domkom'], data['text'])
         )
-        await db.commit()
-        lastrowid = cursor.lastrowid
-        if lastrowid is None:
+        appeal_id = cursor.lastrowid
+        if appeal_id is None:
             raise ValueError("Failed to create appeal")
-        return lastrowid
+        await db.executemany(
+            "INSERT INTO media (appeal_id, file_path, file_type, file_id, file_unique_id) VALUES (?, ?, ?, ?, ?)",
+            [(appeal_id, m['path'], m['type'], m.get('file_id'), m.get('file_unique_id')) for m in media]
+        )
+        await db.commit()
+        return appeal_id
 
-async def add_media(appeal_id: int, file_path: str, file_type: str):
-    async with aiosqlite.connect(DB_FILE) as db:
+async def register_media_blob(file_unique_id: str, file_path: str, size: int):
+    """Записать скачанный файл в media_blobs (refs растут триггером на media)"""
+    async with get_db() as db:
         await db.execute(
-            "INSERT INTO media (appeal_id, file_path, file_type) VALUES (?, ?, ?)",
-            (appeal_id, file_path, file_type)
+            """INSERT INTO media_blobs (file_unique_id, file_path, size) VALUES (?, ?, ?)
+               ON CONFLICT(file_unique_id) DO UPDATE SET size = excluded.size""",
+            (file_unique_id, file_path, size)
         )
         await db.commit()
 
-async def get_appeals(status: str, page: int = 1, per_page: int = 5) -> list:
-    offset = (page - 1) * per_page
-    async with aiosqlite.connect(DB_FILE) as db:
+async def get_orphan_blobs(older_than: float, after: tuple[float, str] = (0.0, ''),
+                           limit: int = 500) -> list[tuple[str, str, int | None, float]]:
+    """Файлы без ссылок из media, скачанные раньше older_than: (file_unique_id, путь, размер, created_at).
+
+    Страница по курсору after = (created_at, file_unique_id) последней строки предыдущей,
+    чтобы пропущенные (ещё нужные сессиям) файлы не заслоняли остальные.
+    """
+    async with get_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM appeals WHERE status = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (status, per_page, offset)
+            """SELECT file_unique_id, file_path, size, created_at FROM media_blobs
+               WHERE refs = 0 AND created_at < ? AND (created_at, file_unique_id) > (?, ?)
+               ORDER BY created_at, file_unique_id LIMIT ?""",
+            (older_than, *after, limit)
         )
         return list(await cursor.fetchall())
 
-async def get_total_pages(status: str, per_page: int = 5) -> int:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT COUNT(*) FROM appeals WHERE status = ?", (status,))
-        result = await cursor.fetchone()
-        if result is None:
-            return 0
-        count = result[0]
-        return (count + per_page - 1) // per_page
-
-async def get_appeal(appeal_id: int) -> dict | None:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT * FROM appeals WHERE id = ?", (appeal_id,))
-        appeal = await cursor.fetchone()
-        if not appeal:
+async def delete_orphan_blob(file_unique_id: str) -> bool:
+    """Удалить запись файла, если на него так и не появилось ссылок (в том числе из архива)"""
+    async with get_db() as db:
+        cursor = await db.execute(
+            """DELETE FROM media_blobs WHERE file_unique_id = ? AND refs = 0
+               AND NOT EXISTS (SELECT 1 FROM archive.media WHERE file_unique_id = ?)""",
+            (file_unique_id, file_unique_id)
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+# Рабочая и архивная таблицы вместе; условия WHERE SQLite переносит внутрь каждой ветки
+_APPEALS_WITH_ARCHIVE = """(SELECT id, created_at, status, user_id, phone_norm FROM main.appeals
+    UNION ALL SELECT id, created_at, status, user_id, phone_norm FROM archive.appeals)"""
+
+async def _fetch_appeals_page(db, where: str, params: tuple, after: tuple | None, before: tuple | None, per_page: int,
+                              include_archive: bool = False):
+    """Keyset-страница (новые сверху) по курсору (created_at, id).
+
+    after — курсор последней строки текущей страницы (листаем вперёд),
+    before — курсор первой строки (листаем назад).
+    """
+    table = _APPEALS_WITH_ARCHIVE if include_archive else "appeals"
+    if before is not None:
+        cursor = await db.execute(
+            f"""SELECT id, created_at, status FROM {table} WHERE {where} AND (created_at, id) > (?, ?)
+                ORDER BY created_at ASC, id ASC LIMIT ?""",
+            (*params, *before, per_page + 1)
+        )
+        rows = list(await cursor.fetchall())
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        keyset = " AND (created_at, id) < (?, ?)" if after is not None else ""
+        cursor = await db.execute(
+            f"""SELECT id, created_at, status FROM {table} WHERE {where}{keyset}
+                ORDER BY created_at DESC, id DESC LIMIT ?""",
+            (*params, *(after or ()), per_page + 1)
+        )
+        rows = list(await cursor.fetchall())
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after is not None
+    return [{'id': r[0], 'created_at': r[1], 'status': r[2]} for r in rows], has_prev, has_next
+
+async def get_appeals(status: str, after: tuple | None = None, before: tuple | None = None, per_page: int = 5):
+    """Страница обращений: (список {'id', 'created_at', 'status'}, есть_предыдущая, есть_следующая)"""
+    async with get_db() as db:
+        return await _fetch_appeals_page(db, "status = ?", (status,), after, before, per_page)
+
+async def get_appeals_by_user(user_id: int, after: tuple | None = None, before: tuple | None = None, per_page: int = 5,
+                              include_archive: bool = False):
+    """История обращений пользователя Telegram (индекс idx_appeals_user_created)"""
+    async with get_db() as db:
+        return await _fetch_appeals_page(db, "user_id = ?", (user_id,), after, before, per_page, include_archive)
+
+async def get_appeals_by_phone(phone: str, after: tuple | None = None, before: tuple | None = None, per_page: int = 5,
+                               include_archive: bool = False):
+    """История обращений по телефону в любом формате (индекс idx_appeals_phone_created)"""
+    async with get_db() as db:
+        return await _fetch_appeals_page(db, "phone_norm = ?", (normalize_phone(phone),), after, before, per_page,
+                                         include_archive)
+
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+def _fts_query(query: str) -> str | None:
+    """Пользовательский ввод -> запрос FTS5: каждое слово как префикс-фраза в кавычках, все обязательны.
+
+    Кавычки исключают синтаксис FTS5 (AND, NEAR, *, ...) во вводе. Слово
+    с апострофом (o'zbek, g‘isht) токенизатор делит на части — они идут
+    одной фразой: "o zbek"*.
+    """
+    phrases = []
+    for word in query.split()[:16]:
+        tokens = _SEARCH_TOKEN.findall(word)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"*')
+    return " ".join(phrases) or None
+
+def _search_select(schema: str) -> str:
+    return f"""SELECT a.id, a.created_at, a.status, snippet(appeals_fts, -1, '', '', '…', 8), appeals_fts.rank AS rank
+               FROM {schema}.appeals_fts JOIN {schema}.appeals a ON a.id = appeals_fts.rowid
+               WHERE appeals_fts MATCH ?"""
+
+async def search_appeals(query: str, page: int = 0, per_page: int = 5, include_archive: bool = False):
+    """Полнотекстовый поиск, лучшие совпадения первыми.
+
+    Возвращает (список {'id', 'created_at', 'status', 'snippet'}, есть_предыдущая, есть_следующая).
+    С include_archive ищет и в архиве (у архива свой FTS-индекс, bm25 считается по каждому отдельно).
+    """
+    match = _fts_query(query)
+    if match is None:
+        return [], False, False
+    if include_archive:
+        sql = f"{_search_select('main')} UNION ALL {_search_select('archive')}"
+        params = (match, match)
+    else:
+        sql = _search_select('main')
+        params = (match,)
+    async with get_db() as db:
+        cursor = await db.execute(f"{sql} ORDER BY rank LIMIT ? OFFSET ?", (*params, per_page + 1, page * per_page))
+        rows = list(await cursor.fetchall())
+    has_next = len(rows) > per_page
+    results = [{'id': r[0], 'created_at': r[1], 'status': r[2], 'snippet': r[3]} for r in rows[:per_page]]
+    return results, page > 0, has_next
+
+async def get_appeal(appeal_id: int, include_archive: bool = True) -> dict | None:
+    """Обращение с медиа; не найдя в рабочей базе, ищет в архиве (appeal['archived'])"""
+    async with get_db() as db:
+        for schema in ("main", "archive") if include_archive else ("main",):
+            cursor = await db.execute(f"SELECT * FROM {schema}.appeals WHERE id = ?", (appeal_id,))
+            appeal = await cursor.fetchone()
+            if appeal:
+                break
+        else:
             return None
         columns = [col[0] for col in cursor.description]
         appeal_dict = dict(zip(columns, appeal))
+        appeal_dict['archived'] = schema == "archive"
 
-        cursor = await db.execute("SELECT file_path, file_type FROM media WHERE appeal_id = ?", (appeal_id,))
+        cursor = await db.execute(
+            f"SELECT file_path, file_type, file_id FROM {schema}.media WHERE appeal_id = ? ORDER BY id", (appeal_id,)
+        )
         media = await cursor.fetchall()
-        appeal_dict['media'] = [{'path': m[0], 'type': m[1]} for m in media]
+        appeal_dict['media'] = [{'path': m[0], 'type': m[1], 'file_id': m[2]} for m in media]
         return appeal_dict
 
-async def process_appeal(appeal_id: int, comment: str | None = None):
-    async with aiosqlite.connect(DB_FILE) as db:
+# Сводки обращений для /status: appeal_id -> {'id', 'user_id', 'status', 'comment', 'created_at'}.
+# Сбрасываются в process_appeal, поэтому смена статуса видна сразу,
+# а повторные запросы гражданина обходятся без базы.
+status_cache = TTLCache(maxsize=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL)
+metrics.collector(lambda: {f"bot_status_cache_{key}": value for key, value in status_cache.stats().items()})
+# Растёт при каждом сбросе: чтение, начатое до изменения, не положит в кэш старую сводку
+_status_generation = 0
+
+def invalidate_appeal_summaries(*appeal_ids: int):
+    global _status_generation
+    _status_generation += 1
+    for appeal_id in appeal_ids:
+        status_cache.invalidate(appeal_id)
+
+async def get_appeal_summary(appeal_id: int) -> dict | None:
+    summary = status_cache.get(appeal_id)
+    if summary is None:
+        generation = _status_generation
+        async with get_db() as db:
+            for schema in ("main", "archive"):
+                cursor = await db.execute(
+                    f"SELECT id, user_id, status, comment, created_at FROM {schema}.appeals WHERE id = ?", (appeal_id,)
+                )
+                row = await cursor.fetchone()
+                if row is not None:
+                    break
+        if row is None:
+            # Отсутствие не кэшируем: обращение с этим id может появиться позже
+            return None
+        summary = {'id': row[0], 'user_id': row[1], 'status': row[2], 'comment': row[3], 'created_at': row[4]}
+        if generation == _status_generation:
+            status_cache.set(appeal_id, summary)
+    return summary
+
+async def process_appeal(appeal_id: int, comment: str | None = None, notification: str | None = None) -> bool:
+    """Отметить обращение обработанным.
+
+    Если передан notification, уведомление автору ставится в outbox
+    в той же транзакции. Возвращает False, если обращения нет.
+    """
+    async with get_db() as db:
         if comment:
-            await db.execute("UPDATE appeals SET status = 'processed', comment = ? WHERE id = ?", (comment, appeal_id))
+            cursor = await db.execute("UPDATE appeals SET status = 'processed', comment = ? WHERE id = ?", (comment, appeal_id))
         else:
-            await db.execute("UPDATE appeals SET status = 'processed' WHERE id = ?", (appeal_id,))
+            cursor = await db.execute("UPDATE appeals SET status = 'processed' WHERE id = ?", (appeal_id,))
+        if not cursor.rowcount:
+            return False
+        if notification:
+            await db.execute(
+                "INSERT INTO outbox (chat_id, text) SELECT user_id, ? FROM appeals WHERE id = ?",
+                (notification, appeal_id)
+            )
         await db.commit()
+    invalidate_appeal_summaries(appeal_id)
+    return True
 
-async def get_unprocessed_count() -> int:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT COUNT(*) FROM appeals WHERE status = 'unprocessed'")
-        result = await cursor.fetchone()
-        if result is None:
+# Предел плейсхолдеров в одном IN (...): старые сборки SQLite допускают 999 параметров
+_IN_CHUNK = 500
+
+async def process_appeals(appeal_ids: list[int], comment: str | None = None,
+                          notification: Callable[[int], str] | None = None) -> list[int]:
+    """Отметить обработанными сразу несколько обращений одной транзакцией.
+
+    Уже обработанные пропускаются. Для каждого обработанного уведомление
+    notification(appeal_id) ставится в outbox в той же транзакции
+    (рассылает его OutboxWorker параллельно). Возвращает id обработанных.
+    """
+    appeal_ids = list(dict.fromkeys(appeal_ids))
+    processed: list[tuple[int, int]] = []
+    async with get_db() as db:
+        for start in range(0, len(appeal_ids), _IN_CHUNK):
+            chunk = appeal_ids[start:start + _IN_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = await db.execute(
+                f"""UPDATE appeals SET status = 'processed', comment = COALESCE(?, comment)
+                    WHERE status = 'unprocessed' AND id IN ({placeholders})
+                    RETURNING id, user_id""",
+                (comment, *chunk)
+            )
+            processed.extend(await cursor.fetchall())
+        if notification and processed:
+            await db.executemany(
+                "INSERT INTO outbox (chat_id, text) VALUES (?, ?)",
+                [(user_id, notification(appeal_id)) for appeal_id, user_id in processed if user_id is not None]
+            )
+        await db.commit()
+    ids = [appeal_id for appeal_id, _ in processed]
+    invalidate_appeal_summaries(*ids)
+    return ids
+
+_ARCHIVE_APPEAL_COLUMNS = "id, user_id, phone, full_name, address, domkom, text, created_at, status, comment, phone_norm"
+_ARCHIVE_MEDIA_COLUMNS = "id, appeal_id, file_path, file_type, file_id, file_unique_id"
+
+async def archive_appeals(older_than_days: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Перенести в архив пачку обработанных обращений старше older_than_days; вернуть их число.
+
+    В WAL-режиме транзакция над несколькими базами не атомарна как целое,
+    поэтому перенос идёт в две транзакции: копия в archive (INSERT OR IGNORE),
+    затем удаление из рабочей базы. Если процесс упадёт между ними, строки
+    останутся в обеих базах, и следующий запуск просто доудалит их.
+    Файлы медиа остаются на месте: refs в media_blobs сохраняются за архивом.
+    """
+    async with get_db() as db:
+        await db.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+        await db.execute("DELETE FROM temp.archive_batch")
+        cursor = await db.execute(
+            """INSERT INTO temp.archive_batch (id)
+               SELECT id FROM main.appeals WHERE status = 'processed' AND created_at < datetime('now', ?)
+               ORDER BY created_at LIMIT ?""",
+            (f"-{older_than_days} days", batch_size)
+        )
+        moved = cursor.rowcount
+        if not moved:
+            await db.commit()
             return 0
-        return result[0]
\ No newline at end of file
+        batch = "SELECT id FROM temp.archive_batch"
+        await db.execute(
+            f"""INSERT OR IGNORE INTO archive.appeals ({_ARCHIVE_APPEAL_COLUMNS})
+                SELECT {_ARCHIVE_APPEAL_COLUMNS} FROM main.appeals WHERE id IN ({batch})"""
+        )
+        await db.execute(
+            f"""INSERT OR IGNORE INTO archive.media ({_ARCHIVE_MEDIA_COLUMNS})
+                SELECT {_ARCHIVE_MEDIA_COLUMNS} FROM main.media WHERE appeal_id IN ({batch})"""
+        )
+        await db.commit()
+
+        # Удаление из media уменьшит refs триггером — заранее возвращаем ссылки, теперь они из архива
+        await db.execute(
+            f"""UPDATE media_blobs SET refs = refs + (
+                    SELECT COUNT(*) FROM main.media m
+                    WHERE m.file_unique_id = media_blobs.file_unique_id AND m.appeal_id IN ({batch}))
+                WHERE file_unique_id IN (SELECT file_unique_id FROM main.media WHERE appeal_id IN ({batch}))"""
+        )
+        await db.execute(f"DELETE FROM main.media WHERE appeal_id IN ({batch})")
+        await db.execute(f"DELETE FROM main.appeals WHERE id IN ({batch})")
+        await db.commit()
+        return moved
+
+async def fetch_outbox_batch(limit: int) -> list[tuple[int, int, str, int]]:
+    """Готовые к отправке уведомления: (id, chat_id, text, attempts)"""
+    async with get_db() as db:
+        cursor = await db.execute(
+            """SELECT id, chat_id, text, attempts FROM outbox
+               WHERE status = 'pending' AND next_attempt_at <= ?
+               ORDER BY next_attempt_at LIMIT ?""",
+            (time.time(), limit)
+        )
+        return list(await cursor.fetchall())
+
+async def complete_outbox(sent_ids: list[int], retries: list[tuple[int, float | None, str]]):
+    """Удалить доставленные и перепланировать неудачные.
+
+    retries: (id, время следующей попытки или None — больше не пытаться, ошибка)
+    """
+    async with get_db() as db:
+        if sent_ids:
+            await db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in sent_ids])
+        if retries:
+            await db.executemany(
+                """UPDATE outbox SET attempts = attempts + 1, last_error = ?,
+                       status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+                       next_attempt_at = COALESCE(?, next_attempt_at)
+                   WHERE id = ?""",
+                [(error, next_at, next_at, outbox_id) for outbox_id, next_at, error in retries]
+            )
+        await db.commit()
+
+async def get_counters(prefix: str = '', schema: str = 'main') -> dict[str, int]:
+    """Счётчики из таблицы counters (поддерживаются триггерами), O(1) на имя.
+
+    schema='archive' — счётчики архивной базы (только appeals и media).
+    """
+    async with get_db() as db:
+        cursor = await db.execute(
+            f"SELECT name, value FROM {schema}.counters WHERE name >= ? AND name < ?",
+            (prefix, prefix + '\uffff')
+        )
+        return {name: value for name, value in await cursor.fetchall()}
+
+async def get_counter(name: str) -> int:
+    async with get_db() as db:
+        cursor = await db.execute("SELECT value FROM counters WHERE name = ?", (name,))
+        result = await cursor.fetchone()
+        return result[0] if result else 0
+
+async def rebuild_counters() -> dict[str, int]:
+    """Пересчитать счётчики с нуля по таблицам основной и архивной базы (проверка согласованности).
+
+    Счётчики архива возвращаются с префиксом 'archive.'.
+    """
+    async with get_db() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        for statement in (*REBUILD_COUNTERS_SQL, *ARCHIVE_REBUILD_COUNTERS_SQL):
+            await db.execute(statement)
+        await db.commit()
+    archived = await get_counters(schema='archive')
+    return {**await get_counters(), **{f"archive.{name}": value for name, value in archived.items()}}
+
+async def get_unprocessed_count() -> int:
+    return await get_counter('appeals:unprocessed')
+
+async def get_unprocessed_ids(up_to_id: int | None = None) -> list[int]:
+    """id всех необработанных обращений (не новее up_to_id, если задан) — индекс idx_appeals_status_created"""
+    async with get_db() as db:
+        cursor = await db.execute(
+            "SELECT id FROM appeals WHERE status = 'unprocessed' AND id <= COALESCE(?, id) ORDER BY id",
+            (up_to_id,)
+        )
+        return [row[0] for row in await cursor.fetchall()]
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_SESSION_TTL
+from database.db import get_db
+
+@dataclass
+class SessionRecord:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в той же базе SQLite (таблица fsm_sessions).
+
+    Чтение идёт через LRU-кэш горячих сессий, записи копятся в памяти
+    и сбрасываются пачкой раз в FSM_FLUSH_INTERVAL секунд (и при закрытии).
+    Сессии, не менявшиеся дольше FSM_SESSION_TTL, удаляются.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None, cache_size: int = FSM_CACHE_SIZE,
+                 flush_interval: float = FSM_FLUSH_INTERVAL, ttl: float = FSM_SESSION_TTL):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._cache: OrderedDict[str, SessionRecord] = OrderedDict()
+        self._dirty: dict[str, SessionRecord] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_expire = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_expire > min(self.ttl, 3600):
+                    await self.expire()
+                    last_expire = time.monotonic()
+            except Exception:
+                logging.exception("Ошибка сохранения FSM-сессий")
+
+    def _remember(self, key: str, record: SessionRecord):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # Несохранённые записи остаются в _dirty до сброса
+            self._cache.popitem(last=False)
+
+    async def _record(self, key: StorageKey) -> tuple[str, SessionRecord]:
+        name = self.key_builder.build(key)
+        record = self._cache.get(name) or self._dirty.get(name)
+        if record is None:
+            async with get_db() as db:
+                cursor = await db.execute(
+                    "SELECT state, data, updated_at FROM fsm_sessions WHERE key = ? AND updated_at >= ?",
+                    (name, time.time() - self.ttl)
+                )
+                row = await cursor.fetchone()
+            record = SessionRecord(row[0], json.loads(row[1]), row[2]) if row else SessionRecord()
+        self._remember(name, record)
+        return name, record
+
+    def _touch(self, name: str, record: SessionRecord):
+        record.updated_at = time.time()
+        self._dirty[name] = record
+        self._start()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(name, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        name, record = await self._record(key)
+        record.data = data.copy()
+        self._touch(name, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            upserts = []
+            deletes = []
+            for name, record in dirty.items():
+                if record.state is None and not record.data:
+                    deletes.append((name,))
+                    continue
+                try:
+                    data = json.dumps(record.data, ensure_ascii=False)
+                except (TypeError, ValueError):
+                    # Одна несериализуемая сессия не должна сорвать запись остальных:
+                    # она остаётся только в памяти (в кэше)
+                    logging.exception("FSM-сессия %s не сериализуется в JSON, не сохранена", name)
+                    continue
+                upserts.append((name, record.state, data, record.updated_at))
+            try:
+                async with get_db() as db:
+                    if deletes:
+                        await db.executemany("DELETE FROM fsm_sessions WHERE key = ?", deletes)
+                    if upserts:
+                        await db.executemany(
+                            """INSERT INTO fsm_sessions (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                               ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,
+                                   updated_at = excluded.updated_at""",
+                            upserts
+                        )
+                    await db.commit()
+            except BaseException:
+                # Не теряем изменения: вернём их, если новее не появилось
+                for name, record in dirty.items():
+                    self._dirty.setdefault(name, record)
+                raise
+
+    async def expire(self) -> int:
+        """Удалить сессии, не менявшиеся дольше ttl"""
+        deadline = time.time() - self.ttl
+        for name in [name for name, record in self._cache.items() if record.updated_at < deadline and name not in self._dirty]:
+            del self._cache[name]
+        async with get_db() as db:
+            cursor = await db.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (deadline,))
+            await db.commit()
+            return cursor.rowcount
+
+    async def all_data(self) -> list[Dict[str, Any]]:
+        """Данные всех живых сессий (после сброса накопленных изменений)"""
+        await self.flush()
+        async with get_db() as db:
+            cursor = await db.execute("SELECT data FROM fsm_sessions WHERE updated_at >= ?", (time.time() - self.ttl,))
+            return [json.loads(row[0]) for row in await cursor.fetchall()]
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,330 @@
+import logging
+import aiosqlite
+from utils.validators import normalize_phone
+
+# Версионированные миграции схемы. Текущая версия хранится в PRAGMA user_version,
+# шаг N применяется, если user_version < N. Шаг — список SQL-выражений
+# или async-функция, принимающая соединение. Новые шаги добавлять только в конец.
+
+# Пересчёт счётчиков с нуля (используется миграцией и командой /recount)
+REBUILD_COUNTERS_SQL = [
+    "DELETE FROM counters WHERE name != 'data_version'",
+    "INSERT INTO counters (name, value) SELECT 'appeals', COUNT(*) FROM appeals",
+    "INSERT INTO counters (name, value) SELECT 'appeals:' || COALESCE(status, ''), COUNT(*) FROM appeals GROUP BY 1",
+    "INSERT INTO counters (name, value) SELECT 'media', COUNT(*) FROM media",
+    "INSERT INTO counters (name, value) SELECT 'media:' || COALESCE(file_type, ''), COUNT(*) FROM media GROUP BY 1",
+    "INSERT INTO counters (name, value) SELECT 'users', COUNT(*) FROM users",
+    "INSERT INTO counters (name, value) SELECT 'users:' || COALESCE(role, ''), COUNT(*) FROM users GROUP BY 1",
+]
+
+# В архиве счётчики только по appeals и media
+ARCHIVE_REBUILD_COUNTERS_SQL = [
+    "DELETE FROM archive.counters",
+    "INSERT INTO archive.counters (name, value) SELECT 'appeals', COUNT(*) FROM archive.appeals",
+    "INSERT INTO archive.counters (name, value) SELECT 'appeals:' || COALESCE(status, ''), COUNT(*) FROM archive.appeals GROUP BY 1",
+    "INSERT INTO archive.counters (name, value) SELECT 'media', COUNT(*) FROM archive.media",
+    "INSERT INTO archive.counters (name, value) SELECT 'media:' || COALESCE(file_type, ''), COUNT(*) FROM archive.media GROUP BY 1",
+]
+
+def _bump(*pairs: tuple[str, int]) -> str:
+    values = ", ".join(f"({name}, {delta})" for name, delta in pairs)
+    return f"INSERT INTO counters (name, value) VALUES {values} ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;"
+
+def _counter_triggers(table: str, column: str, schema: str = "main") -> list[str]:
+    """Триггеры, поддерживающие счётчики '<table>' и '<table>:<column>' (в таблице counters той же базы)"""
+    total = f"'{table}'"
+    new_key = f"'{table}:' || COALESCE(NEW.{column}, '')"
+    old_key = f"'{table}:' || COALESCE(OLD.{column}, '')"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_{table}_counters_insert AFTER INSERT ON {table}
+        BEGIN
+            {_bump((total, 1), (new_key, 1))}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_{table}_counters_delete AFTER DELETE ON {table}
+        BEGIN
+            {_bump((total, -1), (old_key, -1))}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_{table}_counters_update AFTER UPDATE OF {column} ON {table}
+        WHEN OLD.{column} IS NOT NEW.{column}
+        BEGIN
+            {_bump((old_key, -1), (new_key, 1))}
+        END
+        """,
+    ]
+
+# Колонки appeals, участвующие в полнотекстовом поиске
+APPEALS_FTS_COLUMNS = "text, address, full_name, domkom"
+
+def _fts_values(row: str) -> str:
+    return ", ".join(f"{row}.{column.strip()}" for column in APPEALS_FTS_COLUMNS.split(","))
+
+def _fts_statements(schema: str = "main") -> list[str]:
+    """FTS5-индекс appeals_fts и триггеры синхронизации с appeals в базе schema"""
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.appeals_fts USING fts5(
+            {APPEALS_FTS_COLUMNS},
+            content='appeals', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_appeals_fts_insert AFTER INSERT ON appeals
+        BEGIN
+            INSERT INTO appeals_fts (rowid, {APPEALS_FTS_COLUMNS}) VALUES (NEW.id, {_fts_values('NEW')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_appeals_fts_delete AFTER DELETE ON appeals
+        BEGIN
+            INSERT INTO appeals_fts (appeals_fts, rowid, {APPEALS_FTS_COLUMNS}) VALUES ('delete', OLD.id, {_fts_values('OLD')});
+        END
+        """,
+        # Смена статуса/комментария индекс не трогает
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_appeals_fts_update AFTER UPDATE OF {APPEALS_FTS_COLUMNS} ON appeals
+        BEGIN
+            INSERT INTO appeals_fts (appeals_fts, rowid, {APPEALS_FTS_COLUMNS}) VALUES ('delete', OLD.id, {_fts_values('OLD')});
+            INSERT INTO appeals_fts (rowid, {APPEALS_FTS_COLUMNS}) VALUES (NEW.id, {_fts_values('NEW')});
+        END
+        """,
+        f"INSERT INTO {schema}.appeals_fts (appeals_fts) VALUES ('rebuild')",
+    ]
+
+async def _add_phone_norm(db: aiosqlite.Connection):
+    """Нормализованный телефон для поиска истории обращений гражданина"""
+    await db.execute("ALTER TABLE appeals ADD COLUMN phone_norm TEXT")
+    last_id = 0
+    while True:
+        cursor = await db.execute("SELECT id, phone FROM appeals WHERE id > ? ORDER BY id LIMIT 1000", (last_id,))
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        await db.executemany(
+            "UPDATE appeals SET phone_norm = ? WHERE id = ?",
+            [(normalize_phone(phone or ""), appeal_id) for appeal_id, phone in rows]
+        )
+        last_id = rows[-1][0]
+    # id — это rowid, он уже в конце каждого индекса: (phone_norm, created_at, id)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_appeals_phone_created ON appeals (phone_norm, created_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_appeals_user_created ON appeals (user_id, created_at)")
+
+MIGRATIONS = [
+    # 1: базовая схема
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            telegram_id INTEGER PRIMARY KEY,
+            role TEXT DEFAULT 'user'  -- 'user' или 'admin'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS appeals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            phone TEXT,
+            full_name TEXT,
+            address TEXT,
+            domkom TEXT,
+            text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'unprocessed',  -- 'unprocessed' или 'processed'
+            comment TEXT  -- Опциональный комментарий админа
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS media (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            appeal_id INTEGER,
+            file_path TEXT,
+            file_type TEXT  -- 'photo' или 'video'
+        )
+        ''',
+    ],
+    # 2: индексы для списков админа и медиа обращения.
+    # id — это rowid, поэтому (status, created_at) уже покрывает
+    # выборку списка "SELECT id, created_at ... WHERE status = ? ORDER BY created_at".
+    [
+        "CREATE INDEX IF NOT EXISTS idx_appeals_status_created ON appeals (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_media_appeal ON media (appeal_id)",
+    ],
+    # 3: счётчики (общие и по статусу/типу/роли), поддерживаемые триггерами
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,  -- 'appeals', 'appeals:unprocessed', 'media:photo', 'users:admin', ...
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        *_counter_triggers('appeals', 'status'),
+        *_counter_triggers('media', 'file_type'),
+        *_counter_triggers('users', 'role'),
+        *REBUILD_COUNTERS_SQL,
+    ],
+    # 4: версия данных — растёт при любом изменении, ключ кэша выгрузок
+    [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            {_bump(("'data_version'", 1))}
+        END
+        """
+        for table in ('appeals', 'media', 'users')
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ],
+    # 5: outbox — уведомления, записанные в одной транзакции с изменением обращения
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',  -- 'pending' или 'failed' (доставленные удаляются)
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,  -- unix time
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (next_attempt_at) WHERE status = 'pending'",
+    ],
+    # 6: Telegram file_id медиа — повторная отправка без загрузки файла
+    [
+        "ALTER TABLE media ADD COLUMN file_id TEXT",
+        "ALTER TABLE media ADD COLUMN file_unique_id TEXT",
+    ],
+    # 7: контентно-адресуемое хранилище: один файл на file_unique_id,
+    # refs — число строк media, ссылающихся на него
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS media_blobs (
+            file_unique_id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            size INTEGER,
+            refs INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS REAL))
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_media_blobs_ref AFTER INSERT ON media
+        WHEN NEW.file_unique_id IS NOT NULL
+        BEGIN
+            INSERT INTO media_blobs (file_unique_id, file_path, refs) VALUES (NEW.file_unique_id, NEW.file_path, 1)
+            ON CONFLICT(file_unique_id) DO UPDATE SET refs = refs + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_media_blobs_unref AFTER DELETE ON media
+        WHEN OLD.file_unique_id IS NOT NULL
+        BEGIN
+            UPDATE media_blobs SET refs = refs - 1 WHERE file_unique_id = OLD.file_unique_id;
+        END
+        ''',
+        '''
+        INSERT OR IGNORE INTO media_blobs (file_unique_id, file_path, refs)
+        SELECT file_unique_id, MIN(file_path), COUNT(*) FROM media
+        WHERE file_unique_id IS NOT NULL GROUP BY file_unique_id
+        ''',
+    ],
+    # 8: индекс сиротских файлов для сборщика мусора
+    [
+        "CREATE INDEX IF NOT EXISTS idx_media_blobs_orphans ON media_blobs (created_at) WHERE refs = 0",
+    ],
+    # 9: FSM-сессии (SQLiteStorage)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_sessions (
+            key TEXT PRIMARY KEY,  -- fsm:<bot_id>:<chat_id>:<user_id>
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',  -- JSON
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated ON fsm_sessions (updated_at)",
+    ],
+    # 10: полнотекстовый поиск (FTS5) по тексту, адресу, Ф.И.О. и домкому.
+    # External content: текст хранится только в appeals, индекс ведут триггеры
+    _fts_statements(),
+    # 11: phone_norm и индексы истории по телефону и по user_id
+    _add_phone_norm,
+]
+
+# Миграции архивной базы (подключается как schema 'archive', своя user_version).
+# Схема повторяет appeals/media без AUTOINCREMENT: id переносятся как есть
+ARCHIVE_MIGRATIONS = [
+    # 1: обращения, медиа, счётчики и полнотекстовый индекс архива
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS archive.appeals (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            phone TEXT,
+            full_name TEXT,
+            address TEXT,
+            domkom TEXT,
+            text TEXT,
+            created_at TIMESTAMP,
+            status TEXT,
+            comment TEXT,
+            phone_norm TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archive.media (
+            id INTEGER PRIMARY KEY,
+            appeal_id INTEGER,
+            file_path TEXT,
+            file_type TEXT,
+            file_id TEXT,
+            file_unique_id TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS archive.idx_media_appeal ON media (appeal_id)",
+        "CREATE INDEX IF NOT EXISTS archive.idx_media_unique ON media (file_unique_id)",
+        "CREATE INDEX IF NOT EXISTS archive.idx_appeals_created ON appeals (created_at)",
+        "CREATE INDEX IF NOT EXISTS archive.idx_appeals_phone_created ON appeals (phone_norm, created_at)",
+        "CREATE INDEX IF NOT EXISTS archive.idx_appeals_user_created ON appeals (user_id, created_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS archive.counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        *_counter_triggers('appeals', 'status', schema='archive'),
+        *_counter_triggers('media', 'file_type', schema='archive'),
+        *_fts_statements('archive'),
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+async def get_schema_version(db: aiosqlite.Connection, schema: str = "main") -> int:
+    cursor = await db.execute(f"PRAGMA {schema}.user_version")
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+async def migrate(db: aiosqlite.Connection, migrations: list = MIGRATIONS, schema: str = "main"):
+    """Применить недостающие миграции, каждую в своей транзакции"""
+    current = await get_schema_version(db, schema)
+    for version, step in enumerate(migrations, 1):
+        if version <= current:
+            continue
+        logging.info("Миграция БД %s: %s -> %s", schema, version - 1, version)
+        await db.execute("BEGIN")
+        try:
+            if callable(step):
+                await step(db)
+            else:
+                for statement in step:
+                    await db.execute(statement)
+            await db.execute(f"PRAGMA {schema}.user_version = {version}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
@@ -1,13 +1,24 @@
+import asyncio
+import html
 import os
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, FSInputFile, InaccessibleMessage
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, FSInputFile, InaccessibleMessage, InputMediaPhoto, InputMediaVideo
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from database.db import is_admin, get_appeals, get_total_pages, get_appeal, process_appeal, get_unprocessed_count, update_user_role, get_all_users
-from keyboards.inline import get_admin_menu, get_appeals_list_buttons, get_appeal_actions, get_admin_management_menu
+from database.db import is_admin, get_appeals, get_appeal, process_appeals, search_appeals, get_appeals_by_phone, get_appeals_by_user, process_appeal, get_unprocessed_count, update_user_role, get_all_users, rebuild_counters, get_counters, get_unprocessed_ids
+from keyboards.inline import get_admin_menu, get_appeals_list_buttons, get_appeal_actions, get_admin_management_menu, get_search_results_buttons, get_history_buttons, get_bulk_select_buttons
 from states.appeal import AdminForm
-from utils.notifications import notify_admins, notify_user
-from utils.statistics import create_excel_export_async
+from utils.outbox import outbox
+from utils.media_gc import media_gc
+from utils.export_jobs import export_jobs
+from utils.pagination import decode_cursor
+from middlewares.scheduler import chat_scheduler
+from utils.metrics import metrics
+from utils.profiling import profiler
+from utils.archiver import archiver
+from config import PROFILE_MAX_SECONDS
+from utils.validators import validate_phone, normalize_phone, parse_id
 
 router = Router()
 
@@ -33,23 +44,21 @@ async def show_admin_menu(callback: CallbackQuery):
     await callback.message.edit_text(f"Admin panel. Ishlanmagan: {count}", reply_markup=get_admin_menu())
     await callback.answer()
 
+async def render_appeals_list(message: Message, is_unprocessed: bool, after: tuple | None = None, before: tuple | None = None):
+    status = "unprocessed" if is_unprocessed else "processed"
+    appeals, has_prev, has_next = await get_appeals(status, after=after, before=before)
+    await message.edit_text(
+        f"{'Ishlanmagan' if is_unprocessed else 'Ishlangan'} murojaatlar:",
+        reply_markup=get_appeals_list_buttons(appeals, is_unprocessed, has_prev, has_next)
+    )
+
 @router.callback_query(F.data.in_({"unprocessed", "processed"}))
 async def show_appeals_list(callback: CallbackQuery, state: FSMContext):
     if callback.message is None or isinstance(callback.message, InaccessibleMessage):
         await callback.answer("❌ Xabar topilmadi.")
         return
     is_unprocessed = callback.data == "unprocessed"
-    status = "unprocessed" if is_unprocessed else "processed"
-    page = 1
-    appeals = await get_appeals(status, page)
-    total_pages = await get_total_pages(status)
-
-    appeals_list = [{'id': a[0], 'created_at': a[6]} for a in appeals]  # id и дата
-
-    await callback.message.edit_text(
-        f"{'Ishlanmagan' if is_unprocessed else 'Ishlangan'} murojaatlar (sahifa {page}/{total_pages}):",
-        reply_markup=get_appeals_list_buttons(appeals_list, page, total_pages, is_unprocessed)
-    )
+    await render_appeals_list(callback.message, is_unprocessed)
     await state.update_data(is_unprocessed=is_unprocessed)  # Для back
     await callback.answer()
 
@@ -58,21 +67,145 @@ async def paginate_appeals(callback: CallbackQuery, state: FSMContext):
     if callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.data is None:
         await callback.answer("❌ Ma'lumotlar topilmadi.")
         return
-    parts = callback.data.split("_")
-    is_un = parts[1] == "un"
-    page = int(parts[2])
-    status = "unprocessed" if is_un else "processed"
-    appeals = await get_appeals(status, page)
-    total_pages = await get_total_pages(status)
+    direction, kind, raw_cursor = callback.data.split("_", 2)
+    is_un = kind == "un"
+    cursor = decode_cursor(raw_cursor)
+    if direction == "next":
+        await render_appeals_list(callback.message, is_un, after=cursor)
+    else:
+        await render_appeals_list(callback.message, is_un, before=cursor)
+    await callback.answer()
+
+SEARCH_QUERY_ECHO = 100  # Сколько символов запроса повторять в ответе
+
+def _search_results_text(query: str, results: list) -> str:
+    # Предел сообщения Telegram — 4096 символов; режем по целым строкам, чтобы не разорвать HTML
+    shown = html.escape(query if len(query) <= SEARCH_QUERY_ECHO else query[:SEARCH_QUERY_ECHO] + "…")
+    if not results:
+        return f"🔍 «{shown}» bo'yicha hech narsa topilmadi."
+    text = f"🔍 «{shown}» bo'yicha natijalar:\n"
+    for appeal in results:
+        line = f"\n<b>№{appeal['id']}</b> ({appeal['created_at'][:10]}): {html.escape(appeal['snippet'] or '')}\n"
+        if len(text) + len(line) > 4096:
+            break
+        text += line
+    return text.rstrip("\n")
+
+async def show_search_results(message: Message, query: str, page: int = 0, edit: bool = False):
+    results, has_prev, has_next = await search_appeals(query, page=page, include_archive=True)
+    text = _search_results_text(query, results)
+    markup = get_search_results_buttons(results, page, has_prev, has_next)
+    if edit:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    else:
+        await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@router.message(Command("search"))
+async def search_command(message: Message, command: CommandObject, state: FSMContext):
+    if not await check_admin(message):
+        return
+    if not command.args:
+        await state.set_state(AdminForm.waiting_for_search)
+        await message.answer("🔍 Qidiruv so'zlarini kiriting (matn, manzil, F.I.O., MFY):")
+        return
+    await state.update_data(search_query=command.args)
+    await show_search_results(message, command.args)
 
-    appeals_list = [{'id': a[0], 'created_at': a[6]} for a in appeals]
+@router.message(AdminForm.waiting_for_search, F.text)
+async def search_query_process(message: Message, state: FSMContext):
+    if not await check_admin(message) or message.text is None:
+        return
+    await state.set_state(None)
+    await state.update_data(search_query=message.text)
+    await show_search_results(message, message.text)
 
-    await callback.message.edit_text(
-        f"{'Ishlanmagan' if is_un else 'Ishlangan'} (sahifa {page}/{total_pages}):",
-        reply_markup=get_appeals_list_buttons(appeals_list, page, total_pages, is_un)
-    )
+@router.callback_query(F.data.startswith("spage_"))
+async def paginate_search(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.data is None:
+        await callback.answer("❌ Ma'lumotlar topilmadi.")
+        return
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        await callback.answer("Qidiruv eskirgan, /search buyrug'ini qayta yuboring.")
+        return
+    await show_search_results(callback.message, query, page=int(callback.data.split("_")[1]), edit=True)
+    await callback.answer()
+
+async def render_citizen_history(message: Message, scope: str, after: tuple | None = None, before: tuple | None = None, edit: bool = False):
+    """scope: 'p<телефон>' или 'u<telegram_id>'"""
+    key = scope[1:]
+    if scope.startswith("p"):
+        appeals, has_prev, has_next = await get_appeals_by_phone(key, after=after, before=before, include_archive=True)
+        title = f"📞 +{key} raqamidan murojaatlar:"
+    else:
+        appeals, has_prev, has_next = await get_appeals_by_user(int(key), after=after, before=before, include_archive=True)
+        title = f"👤 Foydalanuvchi {key} murojaatlari:"
+    text = title if appeals else f"{title}\n\nHech narsa topilmadi."
+    markup = get_history_buttons(appeals, scope, has_prev, has_next, for_admin=True)
+    if edit:
+        await message.edit_text(text, reply_markup=markup)
+    else:
+        await message.answer(text, reply_markup=markup)
+
+@router.message(Command("citizen"))
+async def citizen_command(message: Message, command: CommandObject):
+    if not await check_admin(message):
+        return
+    arg = (command.args or "").strip()
+    # Telegram ID — только с префиксом id:, иначе 9-значный ID неотличим от местного номера
+    by_id = arg.lower().startswith("id:")
+    user_id = parse_id(arg[3:].strip()) if by_id else None
+    if user_id is not None:
+        scope = f"u{user_id}"
+    elif not by_id and validate_phone(arg):
+        scope = f"p{normalize_phone(arg)}"
+    else:
+        await message.answer("❌ Foydalanish: /citizen <telefon> yoki /citizen id:<Telegram ID>")
+        return
+    await render_citizen_history(message, scope)
+
+@router.callback_query(F.data.startswith("hist_"))
+async def paginate_citizen_history(callback: CallbackQuery):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.data is None:
+        await callback.answer("❌ Ma'lumotlar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    _, scope, direction, raw_cursor = callback.data.split("_", 3)
+    cursor = decode_cursor(raw_cursor)
+    if direction == "next":
+        await render_citizen_history(callback.message, scope, after=cursor, edit=True)
+    else:
+        await render_citizen_history(callback.message, scope, before=cursor, edit=True)
     await callback.answer()
 
+MEDIA_GROUP_LIMIT = 10  # Максимум элементов в альбоме Telegram
+
+def _input_media(m: dict, from_disk: bool):
+    media = FSInputFile(m['path']) if from_disk or not m.get('file_id') else m['file_id']
+    return InputMediaVideo(media=media) if m['type'] == 'video' else InputMediaPhoto(media=media)
+
+async def _send_media_chunk(bot: Bot, chat_id: int, chunk: list[dict], from_disk: bool):
+    if len(chunk) == 1:
+        item = _input_media(chunk[0], from_disk)
+        if isinstance(item, InputMediaVideo):
+            await bot.send_video(chat_id, item.media)
+        else:
+            await bot.send_photo(chat_id, item.media)
+    else:
+        await bot.send_media_group(chat_id, [_input_media(m, from_disk) for m in chunk])
+
+async def send_appeal_media(bot: Bot, chat_id: int, media: list[dict]):
+    """Отправить медиа обращения альбомами по file_id; с диска — только если file_id отклонён"""
+    media = [m for m in media if m['type'] in ('photo', 'video')]
+    for start in range(0, len(media), MEDIA_GROUP_LIMIT):
+        chunk = media[start:start + MEDIA_GROUP_LIMIT]
+        try:
+            await _send_media_chunk(bot, chat_id, chunk, from_disk=False)
+        except TelegramBadRequest:
+            await _send_media_chunk(bot, chat_id, chunk, from_disk=True)
+
 @router.callback_query(F.data.startswith("view_"))
 async def view_appeal(callback: CallbackQuery, bot: Bot):
     if callback.data is None or callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.from_user is None:
@@ -92,33 +225,28 @@ F.I.O.: {appeal['full_name']}
 Manzil: {appeal['address']}
 Uy MFI/OFI: {appeal['domkom']}
 Matn: {appeal['text']}
-Status: {'Ishlanmagan' if appeal['status'] == 'unprocessed' else 'Ishlangan'}
+Status: {'Ishlanmagan' if appeal['status'] == 'unprocessed' else 'Ishlangan'}{' (arxivda)' if appeal['archived'] else ''}
 Izoh: {appeal.get('comment', "Yo'q")}
 """
     await callback.message.edit_text(text, parse_mode="HTML")
 
-    for m in appeal['media']:
-        if m['type'] == 'photo':
-            await bot.send_photo(callback.from_user.id, FSInputFile(m['path']))
-        elif m['type'] == 'video':
-            await bot.send_video(callback.from_user.id, FSInputFile(m['path']))
+    await send_appeal_media(bot, callback.from_user.id, appeal['media'])
 
     is_unprocessed = appeal['status'] == 'unprocessed'
     await bot.send_message(callback.from_user.id, "Harakatlar:", reply_markup=get_appeal_actions(appeal_id, is_unprocessed))
     await callback.answer()
 
 @router.callback_query(F.data.startswith("process_"))
-async def process_appeal_handler(callback: CallbackQuery, bot: Bot):
+async def process_appeal_handler(callback: CallbackQuery):
     if callback.data is None or callback.message is None:
         await callback.answer("❌ Ma'lumotlar topilmadi.")
         return
     appeal_id = int(callback.data.split("_")[1])
-    appeal = await get_appeal(appeal_id)
-    if not appeal:
+    notification = f"Sizning murojaatingiz №{appeal_id} ko'rib chiqish uchun qabul qilindi."
+    if not await process_appeal(appeal_id, notification=notification):
         await callback.answer("Murojaat topilmadi.")
         return
-    await process_appeal(appeal_id)
-    await notify_user(bot, appeal['user_id'], f"Sizning murojaatingiz №{appeal_id} ko'rib chiqish uchun qabul qilindi.")
+    outbox.wake()
     await callback.message.answer("Murojaat ishlandi!")
     await callback.answer()
 
@@ -191,14 +319,16 @@ async def list_admins(callback: CallbackQuery):
     await callback.answer()
 
 @router.message(Command("export"))
-async def export_command(message: Message):
+async def export_command(message: Message, command: CommandObject):
     if not await check_admin(message):
         return
 
+    # /export arxiv — вместе с архивом (отдельный лист)
+    include_archive = (command.args or "").strip().lower() in ("arxiv", "archive", "all")
     await message.answer("📊 Eksport tayyorlanmoqda...")
 
     try:
-        filepath = await create_excel_export_async()
+        filepath = await export_jobs.get_export(include_archive)
         filename = os.path.basename(filepath)
 
         await message.answer_document(
@@ -208,6 +338,112 @@ async def export_command(message: Message):
     except Exception as e:
         await message.answer(f"❌ Xatolik: {e}")
 
+@router.message(Command("recount"))
+async def recount_command(message: Message):
+    if not await check_admin(message):
+        return
+    counters = await rebuild_counters()
+    lines = [f"{name}: {value}" for name, value in sorted(counters.items())]
+    await message.answer("🔄 Hisoblagichlar qayta hisoblandi:\n\n" + "\n".join(lines))
+
+@router.message(Command("gc"))
+async def media_gc_command(message: Message):
+    if not await check_admin(message):
+        return
+    files, freed = await media_gc.sweep_once()
+    await message.answer(
+        f"🧹 Keraksiz fayllar o'chirildi: {files} ta, {freed / 1024 / 1024:.1f} MB\n"
+        f"Jami: {media_gc.reclaimed_files} ta, {media_gc.reclaimed_bytes / 1024 / 1024:.1f} MB"
+    )
+
+@router.message(Command("archive"))
+async def archive_command(message: Message, command: CommandObject):
+    if not await check_admin(message):
+        return
+    arg = (command.args or "").strip()
+    days = parse_id(arg) if arg else archiver.after_days
+    if days is None:
+        await message.answer("❌ Foydalanish: /archive [kun]")
+        return
+    moved = await archiver.run_once(days)
+    archived = await get_counters('appeals', schema='archive')
+    await message.answer(
+        f"🗄 Arxivga ko'chirildi: {moved} ta ({days} kundan eski ishlangan murojaatlar)\n"
+        f"Arxivda jami: {archived.get('appeals', 0)} ta"
+    )
+
+@router.message(Command("queues"))
+async def queues_command(message: Message):
+    if not await check_admin(message):
+        return
+    stats = chat_scheduler.stats()
+    await message.answer(
+        f"⚙️ Navbat: bajarilmoqda {stats['active']}/{chat_scheduler.concurrency}, "
+        f"chatlar {stats['chats']}, kutmoqda {stats['queued']} (eng uzuni {stats['deepest']}, "
+        f"maksimum {stats['max_depth']})\n"
+        f"Bajarildi: {stats['processed']}, tashlab yuborildi: {stats['dropped']}"
+    )
+
+def _format_timings(title: str, rows: list) -> str:
+    lines = [title]
+    for name, histogram in rows:
+        lines.append(
+            f"{name[:60]}: {histogram.count} ta, o'rtacha {histogram.sum / histogram.count * 1000:.1f} ms, "
+            f"p95 ≤{histogram.quantile(0.95) * 1000:.0f} ms, maks {histogram.max * 1000:.0f} ms"
+        )
+    return "\n".join(lines)
+
+@router.message(Command("metrics"))
+async def metrics_command(message: Message):
+    if not await check_admin(message):
+        return
+    # Полные данные — на эндпоинте /metrics; здесь самые затратные по суммарному времени
+    text = "\n\n".join([
+        _format_timings("⏱ Handlerlar:", metrics.top("bot_handler_seconds", "handler", 8)),
+        _format_timings("🗄 SQL so'rovlar:", metrics.top("bot_db_query_seconds", "statement", 8)),
+        _format_timings("📡 Telegram API:", metrics.top("bot_telegram_request_seconds", "method", 8)),
+    ])
+    await message.answer(text[:4096])
+
+_profile_tasks: set[asyncio.Task] = set()
+
+@router.message(Command("profile"))
+async def profile_command(message: Message, command: CommandObject):
+    if not await check_admin(message):
+        return
+    try:
+        seconds = float(command.args or 30)
+    except ValueError:
+        await message.answer("❌ Foydalanish: /profile <soniya>")
+        return
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        await message.answer(f"❌ Davomiylik 0 dan {PROFILE_MAX_SECONDS:g} soniyagacha bo'lishi kerak.")
+        return
+    if profiler.running:
+        await message.answer("⏳ Profillash allaqachon ishlamoqda.")
+        return
+
+    await message.answer(f"🔬 Profillash boshlandi: {seconds:g} soniya...")
+    # Сессия идёт в фоне: иначе очередь чата админа (ChatSchedulerMiddleware) стоит всё это время
+    task = asyncio.create_task(send_profile_report(message, seconds))
+    _profile_tasks.add(task)
+    task.add_done_callback(_profile_tasks.discard)
+
+async def send_profile_report(message: Message, seconds: float):
+    try:
+        report = await profiler.profile(seconds)
+    except Exception as e:
+        await message.answer(f"❌ Xatolik: {e}")
+        return
+    await message.answer_document(
+        FSInputFile(report.report_path),
+        caption=(
+            f"🔬 Hisobot: sikl kechikishi maks {report.lag_max * 1000:.0f} ms, "
+            f"o'rtacha {report.lag_avg * 1000:.1f} ms, sekin callbacklar: {len(report.slow_callbacks)}"
+        )
+    )
+    await message.answer_document(FSInputFile(report.stats_path), caption="📦 pstats dump (snakeviz / pstats)")
+
 @router.message(F.text == "👑 Admin panel")
 async def admin_panel_button(message: Message):
     if not await check_admin(message):
@@ -227,7 +463,7 @@ async def add_comment_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminForm.waiting_for_comment)
-async def add_comment_process(message: Message, state: FSMContext, bot: Bot):
+async def add_comment_process(message: Message, state: FSMContext):
     if message.from_user is None:
         await message.answer("❌ Foydalanuvchi topilmadi.")
         return
@@ -242,15 +478,13 @@ async def add_comment_process(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    appeal = await get_appeal(appeal_id)
-    if not appeal:
+    comment = message.text.strip() if message.text and message.text != "/skip" else None
+    notification = f"Sizning murojaatingiz №{appeal_id} ko'rib chiqish uchun qabul qilindi." + (f"\nIzoh: {comment}" if comment else "")
+    if not await process_appeal(appeal_id, comment, notification=notification):
         await message.answer("❌ Murojaat topilmadi.")
         await state.clear()
         return
-
-    comment = message.text.strip() if message.text and message.text != "/skip" else None
-    await process_appeal(appeal_id, comment)
-    await notify_user(bot, appeal['user_id'], f"Sizning murojaatingiz №{appeal_id} ko'rib chiqish uchun qabul qilindi." + (f"\nIzoh: {comment}" if comment else ""))
+    outbox.wake()
     await message.answer("Izoh qo'shildi va murojaat ishlandi!")
     await state.clear()
 
@@ -263,7 +497,7 @@ async def export_statistics(callback: CallbackQuery):
     await callback.message.edit_text("📊 Eksport tayyorlanmoqda...")
 
     try:
-        filepath = await create_excel_export_async()
+        filepath = await export_jobs.get_export()
         filename = os.path.basename(filepath)
 
         await callback.message.answer_document(
@@ -278,6 +512,154 @@ async def export_statistics(callback: CallbackQuery):
 
 @router.callback_query(F.data == "back_to_list")
 async def back_to_list(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage):
+        await callback.answer("❌ Xabar topilmadi.")
+        return
     data = await state.get_data()
     is_unprocessed = data.get('is_unprocessed', True)
-    await show_appeals_list(callback, state)  # Переиспользуем
\ No newline at end of file
+    await render_appeals_list(callback.message, is_unprocessed)
+    await callback.answer()
+
+# Массовая обработка: отметки на страницах ишланмаган, выбор — в FSM ('bulk_selected'),
+# текущая страница — там же ('bulk_page'), чтобы отметка не требовала запроса к базе.
+# "Выбрать все" хранит только границу ('bulk_all': {'up_to', 'count'}), сами id
+# берутся из базы при обработке — поступившие позже границы не затрагиваются
+
+async def render_bulk_select(message: Message, state: FSMContext, after: tuple | None = None, before: tuple | None = None):
+    appeals, has_prev, has_next = await get_appeals("unprocessed", after=after, before=before)
+    data = await state.update_data(bulk_page={'appeals': appeals, 'has_prev': has_prev, 'has_next': has_next})
+    await show_bulk_page(message, data)
+
+async def show_bulk_page(message: Message, data: dict):
+    page = data['bulk_page']
+    selected = set(data.get('bulk_selected', []))
+    select_all = data.get('bulk_all')
+    count = select_all['count'] if select_all else len(selected)
+    await message.edit_text(
+        f"Ishlanmagan murojaatlarni tanlang. Tanlangan: {count}",
+        reply_markup=get_bulk_select_buttons(page['appeals'], selected, page['has_prev'], page['has_next'],
+                                             select_all=bool(select_all))
+    )
+
+@router.callback_query(F.data == "bulk_start")
+async def bulk_start(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage):
+        await callback.answer("❌ Xabar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    await state.update_data(bulk_selected=[], bulk_all=None)
+    await render_bulk_select(callback.message, state)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("bprev_") | F.data.startswith("bnext_"))
+async def bulk_paginate(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.data is None:
+        await callback.answer("❌ Ma'lumotlar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    direction, raw_cursor = callback.data.split("_", 1)
+    cursor = decode_cursor(raw_cursor)
+    if direction == "bnext":
+        await render_bulk_select(callback.message, state, after=cursor)
+    else:
+        await render_bulk_select(callback.message, state, before=cursor)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("bsel_"))
+async def bulk_toggle(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage) or callback.data is None:
+        await callback.answer("❌ Ma'lumotlar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    data = await state.get_data()
+    if not data.get('bulk_page'):
+        await callback.answer("Tanlov eskirgan, ro'yxatni qayta oching.")
+        return
+    selected = set(data.get('bulk_selected', []))
+    target = callback.data.split("_", 1)[1]
+    if target == "all":
+        if data.get('bulk_all'):
+            data = await state.update_data(bulk_all=None)
+        else:
+            ids = await get_unprocessed_ids()
+            if not ids:
+                await callback.answer("Ishlanmagan murojaatlar yo'q.")
+                return
+            data = await state.update_data(bulk_all={'up_to': ids[-1], 'count': len(ids)}, bulk_selected=[])
+        await show_bulk_page(callback.message, data)
+        await callback.answer()
+        return
+    if data.get('bulk_all'):
+        await callback.answer("Barchasi tanlangan, avval tanlovni bekor qiling.")
+        return
+    if target == "page":
+        page_ids = {appeal['id'] for appeal in data['bulk_page']['appeals']}
+        # Вся страница уже отмечена — снимаем отметки, иначе отмечаем всё
+        selected = selected - page_ids if page_ids <= selected else selected | page_ids
+    else:
+        selected ^= {int(target)}
+    data = await state.update_data(bulk_selected=sorted(selected))
+    await show_bulk_page(callback.message, data)
+    await callback.answer()
+
+async def run_bulk_processing(state: FSMContext, comment: str | None) -> list[int]:
+    data = await state.get_data()
+    if data.get('bulk_all'):
+        selected = await get_unprocessed_ids(data['bulk_all']['up_to'])
+    else:
+        selected = data.get('bulk_selected', [])
+    suffix = f"\nIzoh: {comment}" if comment else ""
+    processed = await process_appeals(
+        selected, comment,
+        notification=lambda appeal_id: f"Sizning murojaatingiz №{appeal_id} ko'rib chiqish uchun qabul qilindi.{suffix}"
+    )
+    outbox.wake()
+    await state.update_data(bulk_selected=[], bulk_all=None, bulk_page=None)
+    return processed
+
+@router.callback_query(F.data == "bulk_go")
+async def bulk_process(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage):
+        await callback.answer("❌ Xabar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    data = await state.get_data()
+    if not data.get('bulk_selected') and not data.get('bulk_all'):
+        await callback.answer("Hech narsa tanlanmagan.")
+        return
+    processed = await run_bulk_processing(state, None)
+    await callback.message.edit_text(f"✅ Ishlandi: {len(processed)} ta murojaat.", reply_markup=get_admin_menu())
+    await callback.answer()
+
+@router.callback_query(F.data == "bulk_comment")
+async def bulk_comment_start(callback: CallbackQuery, state: FSMContext):
+    if callback.message is None or isinstance(callback.message, InaccessibleMessage):
+        await callback.answer("❌ Xabar topilmadi.")
+        return
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("Доступ только админам.")
+        return
+    data = await state.get_data()
+    if not data.get('bulk_selected') and not data.get('bulk_all'):
+        await callback.answer("Hech narsa tanlanmagan.")
+        return
+    await state.set_state(AdminForm.waiting_for_bulk_comment)
+    await callback.message.edit_text("Tanlangan murojaatlar uchun izohni kiriting (yoki /skip agar izohsiz):")
+    await callback.answer()
+
+@router.message(AdminForm.waiting_for_bulk_comment)
+async def bulk_comment_process(message: Message, state: FSMContext):
+    if not await check_admin(message):
+        return
+    comment = message.text.strip() if message.text and message.text != "/skip" else None
+    await state.set_state(None)
+    processed = await run_bulk_processing(state, comment)
+    await message.answer(f"✅ Izoh qo'shildi, ishlandi: {len(processed)} ta murojaat.", reply_markup=get_admin_menu())
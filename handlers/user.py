@@ -1,16 +1,19 @@
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, FSInputFile, InaccessibleMessage
 from aiogram.fsm.context import FSMContext
-from database.db import add_user, create_appeal, add_media, is_admin
+from database.db import add_user, submit_appeal, is_admin, get_appeals_by_user, get_appeal_summary
 from states.appeal import AppealForm
 from keyboards.reply import get_cancel_keyboard, get_back_cancel_keyboard, get_main_user_keyboard, get_main_admin_keyboard, get_phone_keyboard, get_media_keyboard
-from keyboards.inline import get_preview_buttons
-from utils.validators import validate_phone, clean_phone, validate_phone_clean
+from keyboards.inline import get_preview_buttons, get_history_buttons
+from utils.validators import validate_phone, clean_phone, validate_phone_clean, parse_id
 from utils.notifications import notify_admins
+from utils.downloads import downloads
+from utils.pagination import decode_cursor
 from config import MEDIA_DIR
+import html
+import mimetypes
 import os
-import uuid
 
 router = Router()
 
@@ -20,10 +23,10 @@ async def cmd_start(message: Message, state: FSMContext):
         await message.answer("❌ Foydalanuvchi topilmadi.")
         return
     await add_user(message.from_user.id)
+    # Простые ответы возвращаются методом: в webhook-режиме уходят в ответе на запрос
     if await is_admin(message.from_user.id):
-        await message.answer("Salom admin! Harakatni tanlang.", reply_markup=get_main_admin_keyboard())
-    else:
-        await message.answer("Xush kelibsiz! Murojaat yarating.", reply_markup=get_main_user_keyboard())
+        return message.answer("Salom admin! Harakatni tanlang.", reply_markup=get_main_admin_keyboard())
+    return message.answer("Xush kelibsiz! Murojaat yarating.", reply_markup=get_main_user_keyboard())
 
 @router.message(F.text == "📝 Murojaat yaratish")
 async def start_appeal(message: Message, state: FSMContext):
@@ -33,6 +36,7 @@ async def start_appeal(message: Message, state: FSMContext):
     if await is_admin(message.from_user.id):
         return
     await state.clear()
+    downloads.forget(message.from_user.id)
     await state.set_state(AppealForm.phone)
     await message.answer(
         "📱 <b>1-qadam: Telefon raqamingizni yuboring</b>\n\n"
@@ -70,7 +74,7 @@ async def process_full_name(message: Message, state: FSMContext):
         return
     await state.update_data(full_name=message.text.strip())
     await state.set_state(AppealForm.address)
-    await message.answer("3-qadam: Yashash manzilini kiriting.", reply_markup=get_back_cancel_keyboard())
+    return message.answer("3-qadam: Yashash manzilini kiriting.", reply_markup=get_back_cancel_keyboard())
 
 @router.message(AppealForm.address)
 async def process_address(message: Message, state: FSMContext):
@@ -79,7 +83,7 @@ async def process_address(message: Message, state: FSMContext):
         return
     await state.update_data(address=message.text.strip())
     await state.set_state(AppealForm.domkom)
-    await message.answer("4-qadam: Uy MFY/OFY kiriting.", reply_markup=get_back_cancel_keyboard())
+    return message.answer("4-qadam: Uy MFY/OFY kiriting.", reply_markup=get_back_cancel_keyboard())
 
 @router.message(AppealForm.domkom)
 async def process_domkom(message: Message, state: FSMContext):
@@ -88,7 +92,7 @@ async def process_domkom(message: Message, state: FSMContext):
         return
     await state.update_data(domkom=message.text.strip())
     await state.set_state(AppealForm.text)
-    await message.answer("5-qadam: Murojaatingiz.", reply_markup=get_back_cancel_keyboard())
+    return message.answer("5-qadam: Murojaatingiz.", reply_markup=get_back_cancel_keyboard())
 
 @router.message(AppealForm.text)
 async def process_text(message: Message, state: FSMContext):
@@ -105,34 +109,45 @@ async def process_text(message: Message, state: FSMContext):
     )
     await state.update_data(media_files=[])
 
-@router.message(AppealForm.media, F.photo | F.video)
-async def process_media(message: Message, state: FSMContext, bot: Bot):
-    data = await state.get_data()
-    media_files = data.get('media_files', [])
-
+def _media_file(message: Message) -> dict | None:
+    """Описание медиа из сообщения с заранее выбранным путём в MEDIA_DIR"""
     if message.photo:
-        file_id = message.photo[-1].file_id
-        file_type = 'photo'
+        photo = message.photo[-1]
+        file_id, file_unique_id, file_type = photo.file_id, photo.file_unique_id, 'photo'
+        file_ext = '.jpg'  # Telegram всегда отдаёт фото в JPEG
     elif message.video:
-        file_id = message.video.file_id
-        file_type = 'video'
+        video = message.video
+        file_id, file_unique_id, file_type = video.file_id, video.file_unique_id, 'video'
+        file_ext = os.path.splitext(video.file_name or '')[1] or mimetypes.guess_extension(video.mime_type or '') or '.mp4'
     else:
+        return None
+    # Имя по file_unique_id: одинаковый файл хранится на диске один раз
+    file_path = os.path.join(MEDIA_DIR, f"{file_unique_id}{file_ext}")
+    return {'path': file_path, 'type': file_type, 'file_id': file_id, 'file_unique_id': file_unique_id}
+
+@router.message(AppealForm.media, F.photo | F.video)
+async def process_media(message: Message, state: FSMContext, bot: Bot, album: list[Message] | None = None):
+    if message.from_user is None:
+        await message.answer("❌ Foydalanuvchi topilmadi.")
+        return
+    # Альбом приходит целиком (MediaGroupMiddleware): одно обновление FSM и один ответ
+    new_files = [f for f in map(_media_file, album or [message]) if f is not None]
+    if not new_files:
         await message.answer("❌ Xatolik: fayl topilmadi.", reply_markup=get_media_keyboard())
         return
 
-    file_info = await bot.get_file(file_id)
-    if file_info.file_path is None:
-        await message.answer("❌ Xatolik: fayl yo'li topilmadi.", reply_markup=get_media_keyboard())
-        return
-    file_ext = os.path.splitext(file_info.file_path)[1]
-    file_name = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(MEDIA_DIR, file_name)
+    # Скачивание идёт в фоне параллельно; confirm_appeal дождётся его
+    for media in new_files:
+        await downloads.enqueue(bot, media['file_id'], media['file_unique_id'], media['path'], owner=message.from_user.id)
 
-    await bot.download_file(file_info.file_path, file_path)
-    media_files.append({'path': file_path, 'type': file_type})
+    data = await state.get_data()
+    media_files = data.get('media_files', []) + new_files
     await state.update_data(media_files=media_files)
 
-    await message.answer(f"✅ Fayl #{len(media_files)} qo'shildi!\nYana yoki <b>Keyingi</b> tugmasini bosing", reply_markup=get_media_keyboard(), parse_mode="HTML")
+    if len(new_files) == 1:
+        await message.answer(f"✅ Fayl #{len(media_files)} qo'shildi!\nYana yoki <b>Keyingi</b> tugmasini bosing", reply_markup=get_media_keyboard(), parse_mode="HTML")
+    else:
+        await message.answer(f"✅ {len(new_files)} ta fayl qo'shildi (jami {len(media_files)})!\nYana yoki <b>Keyingi</b> tugmasini bosing", reply_markup=get_media_keyboard(), parse_mode="HTML")
 
 @router.message(AppealForm.media, F.text == "Keyingi")
 async def finish_media(message: Message, state: FSMContext):
@@ -181,7 +196,7 @@ async def cancel_appeal(message: Message, state: FSMContext):
         await message.answer("❌ Foydalanuvchi topilmadi.")
         return
     keyboard = get_main_admin_keyboard() if await is_admin(message.from_user.id) else get_main_user_keyboard()
-    await message.answer("✖️ Yaratish bekor qilindi.", reply_markup=keyboard)
+    return message.answer("✖️ Yaratish bekor qilindi.", reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("confirm_"))
 async def confirm_appeal(callback: CallbackQuery, state: FSMContext, bot: Bot):
@@ -190,9 +205,17 @@ async def confirm_appeal(callback: CallbackQuery, state: FSMContext, bot: Bot):
         return
     data = await state.get_data()
     data['user_id'] = callback.from_user.id
-    appeal_id = await create_appeal(data)
-    for media in data.get('media_files', []):
-        await add_media(appeal_id, media['path'], media['type'])
+    owner = callback.from_user.id
+    media_files = data.get('media_files', [])
+    # Сессия могла пережить перезапуск с брошенными загрузками — докачиваем по file_id
+    # (лежащие на диске и уже скачиваемые файлы enqueue повторно не грузит)
+    for media in media_files:
+        if not os.path.exists(media['path']):
+            await downloads.enqueue(bot, media['file_id'], media['file_unique_id'], media['path'], owner=owner)
+    # Ждём только загрузки этого пользователя; не скачавшиеся файлы не сохраняем
+    await downloads.wait_for(owner)
+    media_files = [m for m in media_files if os.path.exists(m['path'])]
+    appeal_id = await submit_appeal(data, media_files)
 
     if callback.message is None:
         await callback.answer("❌ Ошибка: сообщение не найдено.")
@@ -204,11 +227,12 @@ async def confirm_appeal(callback: CallbackQuery, state: FSMContext, bot: Bot):
     await callback.message.answer(
         f"🎉 <b>MUROJAAT YUBORILDI!</b>\n\n"
         f"Kuzatish uchun raqam: <b>№{appeal_id}</b>\n"
-        f"Saqlab qoling! Biz siz bilan bog'lanamiz.",
+        f"Saqlab qoling! Biz siz bilan bog'lanamiz.\n"
+        f"Holatini tekshirish: /status {appeal_id}",
         reply_markup=keyboard,
         parse_mode="HTML"
     )
-    await notify_admins(bot, f"🆕 Новое обращение №{appeal_id} от {data['full_name']}")
+    notify_admins(bot, f"🆕 Новое обращение №{appeal_id} от {data['full_name']}")
     await state.clear()
     await callback.answer()
 
@@ -230,3 +254,59 @@ async def inline_cancel(callback: CallbackQuery, state: FSMContext):
     keyboard = get_main_admin_keyboard() if await is_admin(callback.from_user.id) else get_main_user_keyboard()
     await callback.message.answer("✖️ Bekor qilindi.", reply_markup=keyboard)
     await callback.answer()
+
+STATUS_LABELS = {'unprocessed': "⏳ Ko'rib chiqilmoqda", 'processed': "✅ Ko'rib chiqildi"}
+
+async def render_my_appeals(message: Message, user_id: int, after: tuple | None = None, before: tuple | None = None, edit: bool = False):
+    appeals, has_prev, has_next = await get_appeals_by_user(user_id, after=after, before=before, include_archive=True)
+    if appeals:
+        lines = ["📋 <b>Mening murojaatlarim:</b>", ""]
+        lines += [f"№{a['id']} — {a['created_at'][:10]} — {STATUS_LABELS.get(a['status'], a['status'])}" for a in appeals]
+        text = "\n".join(lines)
+    else:
+        text = "Sizda hali murojaatlar yo'q."
+    markup = get_history_buttons(appeals, "my", has_prev, has_next, for_admin=False)
+    if edit:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    else:
+        await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@router.message(Command("myappeals"))
+async def my_appeals(message: Message):
+    if message.from_user is None:
+        return
+    await render_my_appeals(message, message.from_user.id)
+
+@router.callback_query(F.data.startswith("hist_my_"))
+async def paginate_my_appeals(callback: CallbackQuery):
+    if callback.data is None or callback.message is None or isinstance(callback.message, InaccessibleMessage):
+        await callback.answer("❌ Xabar topilmadi.")
+        return
+    _, _, direction, raw_cursor = callback.data.split("_", 3)
+    cursor = decode_cursor(raw_cursor)
+    if direction == "next":
+        await render_my_appeals(callback.message, callback.from_user.id, after=cursor, edit=True)
+    else:
+        await render_my_appeals(callback.message, callback.from_user.id, before=cursor, edit=True)
+    await callback.answer()
+
+@router.message(Command("status"))
+async def appeal_status(message: Message, command: CommandObject):
+    if message.from_user is None:
+        return
+    arg = (command.args or "").strip().lstrip("№#")
+    appeal_id = parse_id(arg)
+    if appeal_id is None:
+        return message.answer("Foydalanish: /status <murojaat raqami>, masalan /status 125")
+    summary = await get_appeal_summary(appeal_id)
+    # Чужое обращение выглядит как несуществующее
+    if summary is None or (summary['user_id'] != message.from_user.id and not await is_admin(message.from_user.id)):
+        return message.answer(f"❌ №{arg} raqamli murojaat topilmadi.")
+    text = (
+        f"📄 <b>Murojaat №{summary['id']}</b>\n"
+        f"Sana: {summary['created_at'][:16]}\n"
+        f"Holat: {STATUS_LABELS.get(summary['status'], summary['status'])}"
+    )
+    if summary['comment']:
+        text += f"\nIzoh: {html.escape(summary['comment'])}"
+    return message.answer(text, parse_mode="HTML")
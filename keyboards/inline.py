@@ -1,5 +1,6 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from utils.pagination import encode_cursor
 
 def get_preview_buttons(appeal_id: int):
     builder = InlineKeyboardBuilder()
@@ -26,14 +27,80 @@ def get_admin_management_menu():
     builder.adjust(1)
     return builder.as_markup()
 
-def get_appeals_list_buttons(appeals: list, page: int, total_pages: int, is_unprocessed: bool):
+def get_appeals_list_buttons(appeals: list, is_unprocessed: bool, has_prev: bool, has_next: bool):
     builder = InlineKeyboardBuilder()
     for appeal in appeals:
         builder.button(text=f"№{appeal['id']} - {appeal['created_at'][:10]}", callback_data=f"view_{appeal['id']}")
-    if page > 1:
-        builder.button(text="◀️ Oldingi", callback_data=f"prev_{'un' if is_unprocessed else 'pr'}_{page-1}")
-    if page < total_pages:
-        builder.button(text="▶️ Keyingi", callback_data=f"next_{'un' if is_unprocessed else 'pr'}_{page+1}")
+    kind = 'un' if is_unprocessed else 'pr'
+    # В callback_data — курсор (created_at, id) крайней записи страницы
+    if has_prev and appeals:
+        first = appeals[0]
+        builder.button(text="◀️ Oldingi", callback_data=f"prev_{kind}_{encode_cursor(first['created_at'], first['id'])}")
+    if has_next and appeals:
+        last = appeals[-1]
+        builder.button(text="▶️ Keyingi", callback_data=f"next_{kind}_{encode_cursor(last['created_at'], last['id'])}")
+    if is_unprocessed and appeals:
+        builder.button(text="☑️ Bir nechtasini tanlash", callback_data="bulk_start")
+    builder.button(text="🔙 Menyuga", callback_data="admin_menu")
+    builder.adjust(1)
+    return builder.as_markup()
+
+def get_bulk_select_buttons(appeals: list, selected: set, has_prev: bool, has_next: bool, select_all: bool = False):
+    """Страница ишланмаган с отметками; выбор хранится в FSM.
+
+    select_all — выбраны все ишланмаган (id определяются при обработке).
+    """
+    builder = InlineKeyboardBuilder()
+    for appeal in appeals:
+        mark = "✅" if select_all or appeal['id'] in selected else "⬜"
+        builder.button(text=f"{mark} №{appeal['id']} - {appeal['created_at'][:10]}", callback_data=f"bsel_{appeal['id']}")
+    if appeals:
+        if select_all:
+            builder.button(text="✖️ Tanlovni bekor qilish", callback_data="bsel_all")
+        else:
+            builder.button(text="☑️ Sahifani tanlash", callback_data="bsel_page")
+            builder.button(text="☑️ Barcha ishlanmaganlarni tanlash", callback_data="bsel_all")
+    if has_prev and appeals:
+        first = appeals[0]
+        builder.button(text="◀️ Oldingi", callback_data=f"bprev_{encode_cursor(first['created_at'], first['id'])}")
+    if has_next and appeals:
+        last = appeals[-1]
+        builder.button(text="▶️ Keyingi", callback_data=f"bnext_{encode_cursor(last['created_at'], last['id'])}")
+    builder.button(text="✅ Barchasini ishlash" if select_all else f"✅ Tanlanganlarni ishlash ({len(selected)})",
+                   callback_data="bulk_go")
+    builder.button(text="💬 Izoh bilan ishlash", callback_data="bulk_comment")
+    builder.button(text="🔙 Ro'yxatga", callback_data="unprocessed")
+    builder.adjust(1)
+    return builder.as_markup()
+
+def get_history_buttons(appeals: list, scope: str, has_prev: bool, has_next: bool, for_admin: bool):
+    """История обращений гражданина; scope ('my', 'p<телефон>', 'u<user_id>') едет в callback_data"""
+    builder = InlineKeyboardBuilder()
+    if for_admin:
+        for appeal in appeals:
+            mark = "📥" if appeal['status'] == 'unprocessed' else "📤"
+            builder.button(text=f"{mark} №{appeal['id']} - {appeal['created_at'][:10]}", callback_data=f"view_{appeal['id']}")
+    if has_prev and appeals:
+        first = appeals[0]
+        builder.button(text="◀️ Oldingi", callback_data=f"hist_{scope}_prev_{encode_cursor(first['created_at'], first['id'])}")
+    if has_next and appeals:
+        last = appeals[-1]
+        builder.button(text="▶️ Keyingi", callback_data=f"hist_{scope}_next_{encode_cursor(last['created_at'], last['id'])}")
+    if for_admin:
+        builder.button(text="🔙 Menyuga", callback_data="admin_menu")
+    builder.adjust(1)
+    return builder.as_markup()
+
+def get_search_results_buttons(results: list, page: int, has_prev: bool, has_next: bool):
+    builder = InlineKeyboardBuilder()
+    for appeal in results:
+        mark = "📥" if appeal['status'] == 'unprocessed' else "📤"
+        builder.button(text=f"{mark} №{appeal['id']} - {appeal['created_at'][:10]}", callback_data=f"view_{appeal['id']}")
+    # Сам запрос хранится в FSM, в callback_data — только номер страницы
+    if has_prev:
+        builder.button(text="◀️ Oldingi", callback_data=f"spage_{page - 1}")
+    if has_next:
+        builder.button(text="▶️ Keyingi", callback_data=f"spage_{page + 1}")
     builder.button(text="🔙 Menyuga", callback_data="admin_menu")
     builder.adjust(1)
     return builder.as_markup()
@@ -0,0 +1,2 @@
+# Мидлвари диспетчера
+from . import media_group, scheduler, metrics
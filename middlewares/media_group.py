@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+from config import MEDIA_GROUP_WINDOW
+
+class MediaGroupMiddleware(BaseMiddleware):
+    """Собирает альбом (сообщения с общим media_group_id) в одну обработку.
+
+    Первое сообщение альбома сразу идёт дальше, в очередь чата
+    (ChatSchedulerMiddleware, регистрируется после этой мидлвари), и несёт
+    data['album'] и ожидание data['album_ready']. Очередь, дойдя до альбома,
+    ждёт, пока новые части перестанут приходить (окно MEDIA_GROUP_WINDOW),
+    и только потом вызывает хендлер — сообщения, отправленные после альбома,
+    не обгоняют его. Остальные части хендлер не вызывают.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW):
+        self.window = window
+        self._albums: dict[str, list[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        message = event.message if isinstance(event, Update) else None
+        if message is None or message.media_group_id is None:
+            return await handler(event, data)
+
+        group_id = message.media_group_id
+        album = self._albums.get(group_id)
+        if album is not None:
+            album.append(message)
+            return None
+
+        self._albums[group_id] = album = [message]
+        data['album'] = album
+        data['album_ready'] = ready = self._collect(group_id, album)
+        try:
+            return await handler(event, data)
+        finally:
+            # Апдейт мог быть отброшен очередью — тогда сбор так и не начался
+            self._albums.pop(group_id, None)
+            ready.close()
+
+    async def _collect(self, group_id: str, album: list[Message]):
+        """Дождаться конца альбома; вызывается очередью чата"""
+        try:
+            while True:
+                size = len(album)
+                await asyncio.sleep(self.window)
+                if len(album) == size:
+                    break
+        finally:
+            self._albums.pop(group_id, None)
+        album.sort(key=lambda m: m.message_id)
@@ -0,0 +1,52 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from utils.metrics import metrics
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренняя мидлварь: время работы каждого хендлера (cmd_start, process_media, ...).
+
+    Регистрируется на dp.message и dp.callback_query — к этому моменту
+    хендлер уже выбран и лежит в data['handler'].
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(handler_object.callback, "__name__", "unknown") if handler_object else "unknown"
+        labels = {"handler": name}
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            metrics.inc("bot_handler_errors_total", {"handler": name, "error": type(e).__name__})
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", time.perf_counter() - started, labels)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Мидлварь сессии бота: число, время и ошибки вызовов Bot API по методам"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        labels = {"method": type(method).__name__}
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.inc("bot_telegram_errors_total", {**labels, "error": type(e).__name__})
+            raise
+        finally:
+            metrics.observe("bot_telegram_request_seconds", time.perf_counter() - started, labels)
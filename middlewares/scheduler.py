@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from config import UPDATE_CONCURRENCY, CHAT_QUEUE_SIZE
+from utils.metrics import metrics
+
+class ChatQueue:
+    """Очередь апдейтов одного чата: asyncio.Lock пропускает ожидающих по порядку (FIFO)"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+        self.processed = 0
+
+class ChatSchedulerMiddleware(BaseMiddleware):
+    """Апдейты одного чата — строго по очереди, разных чатов — параллельно.
+
+    Последовательность внутри чата защищает FSM-данные (process_media,
+    шаги AppealForm) от гонок, а медленная загрузка или выгрузка одного
+    пользователя не задерживает остальных. Одновременно обрабатывается
+    не больше concurrency апдейтов; в очереди одного чата ждут не больше
+    queue_size апдейтов, лишние отбрасываются.
+
+    FSMContextMiddleware aiogram читает состояние (raw_state) раньше,
+    ещё до очереди, поэтому после захвата очереди оно перечитывается:
+    апдейт видит состояние, оставленное предыдущим апдейтом чата.
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, queue_size: int = CHAT_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chats: dict[int, ChatQueue] = {}
+        self.active = 0
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @staticmethod
+    def _chat_id(data: Dict[str, Any]) -> int | None:
+        chat = data.get("event_chat")
+        if chat is not None:
+            return chat.id
+        user = data.get("event_from_user")
+        return user.id if user is not None else None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat_id = self._chat_id(data)
+        album_ready = data.pop('album_ready', None)
+        if chat_id is None:
+            if album_ready is not None:
+                await album_ready
+            async with self._semaphore:
+                return await handler(event, data)
+
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = ChatQueue()
+        if queue.waiting >= self.queue_size:
+            self.dropped += 1
+            logging.warning("Очередь чата %s переполнена, апдейт отброшен", chat_id)
+            return None
+
+        queue.waiting += 1
+        self.max_depth = max(self.max_depth, queue.waiting)
+        try:
+            # Сначала очередь чата, потом общий слот: ждущий своей очереди слот не занимает
+            await queue.lock.acquire()
+        except BaseException:
+            queue.waiting -= 1
+            self._release(chat_id, queue)
+            raise
+        queue.waiting -= 1
+        try:
+            # Альбом (MediaGroupMiddleware) дособирается уже в очереди чата, но без общего слота
+            if album_ready is not None:
+                await album_ready
+            if 'state' in data:
+                data['raw_state'] = await data['state'].get_state()
+            async with self._semaphore:
+                self.active += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.active -= 1
+                    queue.processed += 1
+                    self.processed += 1
+        finally:
+            queue.lock.release()
+            self._release(chat_id, queue)
+
+    def _release(self, chat_id: int, queue: ChatQueue):
+        # Пустые очереди не храним, чтобы словарь не рос с числом пользователей
+        if queue.waiting == 0 and not queue.lock.locked() and self._chats.get(chat_id) is queue:
+            del self._chats[chat_id]
+
+    def stats(self) -> dict:
+        depths = {chat_id: queue.waiting for chat_id, queue in self._chats.items() if queue.waiting}
+        return {
+            'active': self.active,
+            'chats': len(self._chats),
+            'queued': sum(depths.values()),
+            'deepest': max(depths.values(), default=0),
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'dropped': self.dropped,
+        }
+
+chat_scheduler = ChatSchedulerMiddleware()
+metrics.collector(lambda: {f"bot_updates_{key}": value for key, value in chat_scheduler.stats().items()})
@@ -11,4 +11,6 @@ class AppealForm(StatesGroup):
 
 class AdminForm(StatesGroup):
     waiting_for_user_id = State()  # Ожидание ID пользователя для добавления в админы
-    waiting_for_comment = State()  # Ожидание комментария к обращению
\ No newline at end of file
+    waiting_for_comment = State()  # Ожидание комментария к обращению
+    waiting_for_search = State()  # Ожидание поискового запроса
+    waiting_for_bulk_comment = State()  # Ожидание комментария к выбранным обращениям
\ No newline at end of file
@@ -0,0 +1,4 @@
+import os
+
+# config.py требует токен при импорте; запросов к Telegram тесты не делают
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
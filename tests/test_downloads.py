@@ -0,0 +1,27 @@
+import asyncio
+import os
+from utils.downloads import DownloadQueue
+
+class HangingBot:
+    """Пишет часть файла и зависает — как загрузка, прерванная остановкой"""
+
+    async def download(self, file_id: str, destination: str):
+        with open(destination, "wb") as f:
+            f.write(b"partial")
+        await asyncio.Event().wait()
+
+def test_stop_fails_pending_downloads_and_removes_part_files(tmp_path):
+    async def scenario():
+        queue = DownloadQueue(workers=1)
+        active = str(tmp_path / "active.jpg")
+        queued = str(tmp_path / "queued.jpg")
+        first = await queue.enqueue(HangingBot(), "f1", "u1", active, owner=1)
+        second = await queue.enqueue(HangingBot(), "f2", "u2", queued, owner=1)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return first.result(), second.result(), await queue.wait_for(1), os.listdir(tmp_path)
+
+    first, second, failed, files = asyncio.run(scenario())
+    assert first is None and second is None
+    assert failed == {str(tmp_path / "active.jpg"), str(tmp_path / "queued.jpg")}
+    assert files == []
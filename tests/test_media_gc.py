@@ -0,0 +1,42 @@
+import asyncio
+from database import db
+from utils import media_gc as gc
+from utils.downloads import downloads
+
+def test_blob_claimed_during_sweep_is_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "reused.jpg")
+    with open(path, "wb") as f:
+        f.write(b"jpeg")
+
+    async def delete_and_claim(file_unique_id: str) -> bool:
+        deleted = await db.delete_orphan_blob(file_unique_id)
+        # Новая сессия присылает тот же файл, пока сборщик удаляет запись
+        await downloads.enqueue(None, "file-id", file_unique_id, path, owner=1)
+        return deleted
+
+    monkeypatch.setattr(gc, "delete_orphan_blob", delete_and_claim)
+
+    async def scenario():
+        await db.init_db()
+        try:
+            async with db.get_db() as conn:
+                await conn.execute(
+                    "INSERT INTO media_blobs (file_unique_id, file_path, size, created_at) VALUES ('u1', ?, 4, 0)",
+                    (path,)
+                )
+                await conn.commit()
+            collector = gc.MediaGarbageCollector(grace=60)
+            result = await collector.sweep_once()
+            async with db.get_db() as conn:
+                cursor = await conn.execute("SELECT file_path FROM media_blobs WHERE file_unique_id = 'u1'")
+                row = await cursor.fetchone()
+            return result, row
+        finally:
+            await downloads.stop()
+            await db.close_db()
+
+    result, row = asyncio.run(scenario())
+    assert result == (0, 0)
+    assert row == (path,)
+    assert (tmp_path / "reused.jpg").exists()
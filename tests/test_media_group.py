@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Chat, Message, Update, User
+from middlewares.media_group import MediaGroupMiddleware
+from middlewares.scheduler import ChatSchedulerMiddleware
+
+class Form(StatesGroup):
+    media = State()
+    next = State()
+
+def _update(update_id: int, text: str, media_group_id: str | None = None) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=1, type="private"),
+        from_user=User(id=1, is_bot=False, first_name="Test"),
+        text=text,
+        media_group_id=media_group_id,
+    )
+    return Update(update_id=update_id, message=message)
+
+def test_message_sent_during_album_window_does_not_overtake_album():
+    async def scenario():
+        seen: list[str] = []
+        router = Router()
+
+        @router.message(StateFilter(Form.media))
+        async def collect_media(message: Message, state: FSMContext, album: list[Message] | None = None):
+            seen.append("media:" + ",".join(m.text or "" for m in album or [message]))
+            await state.set_state(Form.next)
+
+        @router.message(StateFilter(Form.next))
+        async def next_step(message: Message):
+            seen.append(f"next:{message.text}")
+
+        dp = Dispatcher()
+        dp.update.outer_middleware(MediaGroupMiddleware(window=0.1))
+        dp.update.outer_middleware(ChatSchedulerMiddleware())
+        dp.include_router(router)
+        bot = Bot("42:TEST")
+        await dp.fsm.get_context(bot, chat_id=1, user_id=1).set_state(Form.media)
+
+        async def send(update: Update, delay: float):
+            await asyncio.sleep(delay)
+            await dp.feed_update(bot, update)
+
+        await asyncio.gather(
+            send(_update(1, "p1", "g"), 0),
+            send(_update(2, "p2", "g"), 0.02),
+            send(_update(3, "Keyingi"), 0.04),
+        )
+        return seen
+
+    assert asyncio.run(scenario()) == ["media:p1,p2", "next:Keyingi"]
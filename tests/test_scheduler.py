@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Chat, Message, Update, User
+from middlewares.scheduler import ChatSchedulerMiddleware
+
+class Form(StatesGroup):
+    a = State()
+    b = State()
+
+def _update(update_id: int, chat_id: int, text: str) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        from_user=User(id=chat_id, is_bot=False, first_name="Test"),
+        text=text,
+    )
+    return Update(update_id=update_id, message=message)
+
+def test_queued_update_sees_state_set_by_previous_one():
+    async def scenario():
+        seen: list[str] = []
+        router = Router()
+
+        @router.message(StateFilter(Form.a))
+        async def step_a(message: Message, state: FSMContext):
+            seen.append(f"a:{message.text}")
+            await asyncio.sleep(0.05)
+            await state.set_state(Form.b)
+
+        @router.message(StateFilter(Form.b))
+        async def step_b(message: Message):
+            seen.append(f"b:{message.text}")
+
+        dp = Dispatcher()
+        dp.update.outer_middleware(ChatSchedulerMiddleware())
+        dp.include_router(router)
+        bot = Bot("42:TEST")
+        await dp.fsm.get_context(bot, chat_id=1, user_id=1).set_state(Form.a)
+
+        await asyncio.gather(dp.feed_update(bot, _update(1, 1, "first")), dp.feed_update(bot, _update(2, 1, "second")))
+        return seen
+
+    assert asyncio.run(scenario()) == ["a:first", "b:second"]
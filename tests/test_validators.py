@@ -0,0 +1,9 @@
+from utils.validators import parse_id
+
+def test_parse_id_accepts_bounded_ascii_digits():
+    assert parse_id("125") == 125
+    assert parse_id("9" * 18) == int("9" * 18)
+
+def test_parse_id_rejects_input_sqlite_or_int_cannot_take():
+    for text in ["", "9" * 19, "²", "１２", "-1", "12a"]:
+        assert parse_id(text) is None
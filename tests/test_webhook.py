@@ -0,0 +1,53 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Message
+from utils.webhook import LimitedRequestHandler
+
+def _update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id, "type": "private"},
+            "from": {"id": update_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+def test_slot_is_held_until_slow_handler_finishes():
+    async def scenario():
+        events: list[str] = []
+        router = Router()
+
+        @router.message(F.text == "slow")
+        async def slow(message: Message):
+            events.append(f"start:{message.message_id}")
+            await asyncio.sleep(0.2)
+            events.append(f"end:{message.message_id}")
+
+        @router.message(F.text == "fast")
+        async def fast(message: Message):
+            return message.answer("ok")
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        app = web.Application()
+        handler = LimitedRequestHandler(dispatcher=dp, bot=Bot("42:TEST"), max_concurrency=1, reply_timeout=0.05)
+        app.router.add_post("/webhook", handler.handle)
+
+        async with TestClient(TestServer(app)) as client:
+            first = await client.post("/webhook", json=_update(1, "slow"))
+            assert first.status == 200
+            # Ответ уже ушёл, но хендлер ещё работает — второй апдейт ждёт слот
+            second = await client.post("/webhook", json=_update(2, "slow"))
+            assert second.status == 200
+            await asyncio.sleep(0.5)
+            reply = await (await client.post("/webhook", json=_update(3, "fast"))).text()
+        return events, reply
+
+    events, reply = asyncio.run(scenario())
+    assert events == ["start:1", "end:1", "start:2", "end:2"]
+    assert "sendMessage" in reply
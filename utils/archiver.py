@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL
+from database.db import archive_appeals
+from utils.metrics import metrics
+
+class Archiver:
+    """Периодически переносит обработанные обращения старше after_days в архивную базу.
+
+    Переносит пачками (ARCHIVE_BATCH_SIZE на транзакцию), уступая цикл
+    событий между пачками, чтобы не держать запись в базе надолго.
+    """
+
+    def __init__(self, after_days: int = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL):
+        self.after_days = after_days
+        self.interval = interval
+        self.archived = 0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logging.exception("Ошибка переноса в архив")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, after_days: int | None = None) -> int:
+        """Перенести всё, что подходит; вернуть число перенесённых обращений"""
+        days = self.after_days if after_days is None else after_days
+        total = 0
+        # Фоновый проход и /archive не должны переносить одновременно
+        async with self._lock:
+            while True:
+                moved = await archive_appeals(days)
+                if not moved:
+                    break
+                total += moved
+                await asyncio.sleep(0)
+        self.archived += total
+        if total:
+            logging.info("Архив: перенесено %s обращений старше %s дн.", total, days)
+        return total
+
+archiver = Archiver()
+metrics.collector(lambda: {"bot_archived_appeals": archiver.archived})
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterable
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from config import TG_GLOBAL_RATE, TG_PER_CHAT_RATE, BROADCAST_CONCURRENCY, SEND_MAX_RETRIES
+from utils.cache import TTLCache
+
+class TokenBucket:
+    """Token bucket: не больше rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Ожидающие обслуживаются по очереди (asyncio.Lock — FIFO)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class RateLimiter:
+    """Лимиты Telegram: общий на бота и отдельный на каждый чат"""
+
+    def __init__(self, global_rate: float = TG_GLOBAL_RATE, per_chat_rate: float = TG_PER_CHAT_RATE):
+        self.per_chat_rate = per_chat_rate
+        self._global = TokenBucket(global_rate)
+        # Простаивающий чат за минуту снова набирает полный bucket, его можно забыть
+        self._chats = TTLCache(maxsize=10000, ttl=60)
+
+    async def acquire(self, chat_id: int):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate)
+        self._chats.set(chat_id, bucket)
+        await bucket.acquire()
+        await self._global.acquire()
+
+limiter = RateLimiter()
+
+async def send_message(bot: Bot, chat_id: int, text: str, **kwargs):
+    """send_message с учётом лимитов и повтором после RetryAfter"""
+    for attempt in range(SEND_MAX_RETRIES):
+        await limiter.acquire(chat_id)
+        try:
+            return await bot.send_message(chat_id, text, **kwargs)
+        except TelegramRetryAfter as e:
+            if attempt == SEND_MAX_RETRIES - 1:
+                raise
+            logging.warning("Flood control для %s: ждём %s с", chat_id, e.retry_after)
+            await asyncio.sleep(e.retry_after)
+
+@dataclass
+class BroadcastResult:
+    delivered: int = 0
+    failed: int = 0
+    errors: dict[int, str] = field(default_factory=dict)
+
+async def broadcast(bot: Bot, chat_ids: Iterable[int], text: str, concurrency: int = BROADCAST_CONCURRENCY) -> BroadcastResult:
+    """Разослать сообщение параллельно (не больше concurrency одновременно)"""
+    result = BroadcastResult()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(chat_id: int):
+        async with semaphore:
+            try:
+                await send_message(bot, chat_id, text)
+                result.delivered += 1
+            except Exception as e:
+                result.failed += 1
+                result.errors[chat_id] = str(e)
+                logging.warning("Не удалось доставить сообщение %s: %s", chat_id, e)
+
+    await asyncio.gather(*(deliver(chat_id) for chat_id in set(chat_ids)))
+    logging.info("Рассылка: доставлено %s, ошибок %s", result.delivered, result.failed)
+    return result
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+_background_tasks: set[asyncio.Task] = set()
+
+def broadcast_in_background(bot: Bot, chat_ids: Iterable[int], text: str) -> asyncio.Task[BroadcastResult]:
+    task = asyncio.create_task(broadcast(bot, list(chat_ids), text))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from aiogram import Bot
+from config import DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE
+from database.db import register_media_blob
+from utils.metrics import metrics
+
+@dataclass
+class DownloadJob:
+    bot: Bot
+    file_id: str
+    file_unique_id: str
+    path: str
+    future: asyncio.Future
+    owners: set[int] = field(default_factory=set)
+
+class DownloadQueue:
+    """Ограниченная очередь загрузки медиа в MEDIA_DIR с пулом воркеров.
+
+    Хендлер ставит файл в очередь и сразу отвечает пользователю;
+    confirm_appeal ждёт только загрузки своего владельца (wait_for).
+    Путь файла определяется его file_unique_id, поэтому уже лежащий
+    на диске или уже скачиваемый файл повторно не загружается.
+    """
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, maxsize: int = DOWNLOAD_QUEUE_SIZE):
+        self.workers = workers
+        self._queue: asyncio.Queue[DownloadJob] = asyncio.Queue(maxsize)
+        self._tasks: list[asyncio.Task] = []
+        self._inflight: dict[str, DownloadJob] = {}
+        self._pending: dict[int, set[asyncio.Future]] = {}
+        self._failed: dict[int, set[str]] = {}
+        self._claimed: dict[str, float] = {}
+        self.active = 0
+        self.completed = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Так и не начатые загрузки: ждущие их получают отказ, а не висят вечно
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._fail(job)
+            self._finish(job)
+            self._queue.task_done()
+
+    async def enqueue(self, bot: Bot, file_id: str, file_unique_id: str, path: str, owner: int) -> asyncio.Future:
+        """Поставить файл в очередь; при переполнении ждёт свободного места.
+
+        Future завершится путём к файлу или None, если загрузка не удалась.
+        """
+        self.start()
+        # Отметка для сборщика медиа: файл нужен сессии, даже если она ещё не сохранила путь
+        self._claimed[path] = time.time()
+        job = self._inflight.get(path)
+        if job is not None:
+            # Этот же файл уже скачивается — присоединяемся
+            self.deduplicated += 1
+            job.owners.add(owner)
+            self._pending.setdefault(owner, set()).add(job.future)
+            return job.future
+
+        future = asyncio.get_running_loop().create_future()
+        if os.path.exists(path):
+            self.deduplicated += 1
+            future.set_result(path)
+            return future
+
+        job = DownloadJob(bot, file_id, file_unique_id, path, future, {owner})
+        self._inflight[path] = job
+        self._pending.setdefault(owner, set()).add(future)
+        await self._queue.put(job)
+        return future
+
+    async def wait_for(self, owner: int) -> set[str]:
+        """Дождаться загрузок владельца; вернуть пути, которые скачать не удалось"""
+        pending = self._pending.get(owner)
+        if pending:
+            await asyncio.gather(*pending)
+        return self._failed.pop(owner, set())
+
+    def forget(self, owner: int):
+        """Сбросить ошибки прошлой (брошенной) сессии владельца"""
+        self._failed.pop(owner, None)
+
+    def inflight_paths(self) -> set[str]:
+        return set(self._inflight)
+
+    def in_use(self, path: str, since: float) -> bool:
+        """Файл скачивается или был запрошен (enqueue) не раньше since"""
+        return path in self._inflight or self._claimed.get(path, 0.0) >= since
+
+    def prune_claims(self, before: float):
+        self._claimed = {path: at for path, at in self._claimed.items() if at >= before}
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'active': self.active,
+            'completed': self.completed,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'bytes_per_second': self.bytes / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+    def _fail(self, job: DownloadJob):
+        self.failed += 1
+        for owner in job.owners:
+            self._failed.setdefault(owner, set()).add(job.path)
+        if not job.future.done():
+            job.future.set_result(None)
+
+    def _finish(self, job: DownloadJob):
+        self._inflight.pop(job.path, None)
+        for owner in job.owners:
+            pending = self._pending.get(owner)
+            if pending is not None:
+                pending.discard(job.future)
+                if not pending:
+                    del self._pending[owner]
+
+    async def _download(self, job: DownloadJob) -> int:
+        # Сначала во временный файл: недокачанный файл не должен считаться готовым
+        partial = job.path + ".part"
+        try:
+            await job.bot.download(job.file_id, destination=partial)
+            os.replace(partial, job.path)
+        except BaseException:
+            # В том числе отмена при остановке: .part не должен оставаться на диске
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        size = os.path.getsize(job.path)
+        await register_media_blob(job.file_unique_id, job.path, size)
+        return size
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.active += 1
+            started = time.monotonic()
+            try:
+                self.bytes += await self._download(job)
+                self.completed += 1
+                job.future.set_result(job.path)
+            except Exception as e:
+                self._fail(job)
+                logging.warning("Не удалось скачать файл %s: %s", job.file_id, e)
+            except asyncio.CancelledError:
+                self._fail(job)
+                raise
+            finally:
+                self.busy_seconds += time.monotonic() - started
+                self.active -= 1
+                self._finish(job)
+                self._queue.task_done()
+
+downloads = DownloadQueue()
+metrics.collector(lambda: {f"bot_downloads_{key}": value for key, value in downloads.stats().items()})
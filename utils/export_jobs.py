@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import time
+from config import EXPORTS_DIR, EXPORT_MAX_AGE_HOURS, EXPORT_MAX_TOTAL_MB
+from database.db import get_counter
+from utils.statistics import create_excel_export_async
+
+class ExportJobManager:
+    """Выгрузки статистики: одна задача на всех и повторное использование файла.
+
+    Одновременные запросы ждут одну и ту же задачу. Готовый файл отдаётся
+    снова, пока не изменилась версия данных (счётчик 'data_version').
+    Выгрузки с архивом и без него кэшируются отдельно.
+    """
+
+    def __init__(self, export_dir: str = EXPORTS_DIR,
+                 max_age: float = EXPORT_MAX_AGE_HOURS * 3600,
+                 max_total_bytes: float = EXPORT_MAX_TOTAL_MB * 1024 * 1024):
+        self.export_dir = export_dir
+        self.max_age = max_age
+        self.max_total_bytes = max_total_bytes
+        self._tasks: dict[bool, asyncio.Task[str]] = {}
+        self._cached: dict[bool, tuple[int, str]] = {}  # с архивом? -> (версия данных, путь)
+
+    async def get_export(self, include_archive: bool = False) -> str:
+        # Перенос в архив удаляет строки из рабочей базы, так что data_version растёт и от него
+        version = await get_counter('data_version')
+        cached = self._cached.get(include_archive)
+        if cached is not None:
+            cached_version, path = cached
+            if cached_version == version and os.path.exists(path):
+                return path
+        task = self._tasks.get(include_archive)
+        if task is None or task.done():
+            task = self._tasks[include_archive] = asyncio.create_task(self._run(version, include_archive))
+        # shield: отмена одного ожидающего не должна останавливать общую задачу
+        return await asyncio.shield(task)
+
+    async def _run(self, version: int, include_archive: bool) -> str:
+        path = await create_excel_export_async(include_archive)
+        self._cached[include_archive] = (version, path)
+        await asyncio.to_thread(self.evict)
+        return path
+
+    def evict(self):
+        """Удалить выгрузки старше max_age и самые старые сверх max_total_bytes"""
+        keep = {path for _, path in self._cached.values()}
+        files = []
+        for entry in os.scandir(self.export_dir):
+            if entry.is_file() and entry.name.startswith("statistics_") and entry.name.endswith(".xlsx"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()  # Сначала самые старые
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if path in keep:
+                continue
+            if now - mtime > self.max_age or total > self.max_total_bytes:
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError as e:
+                    logging.warning("Не удалось удалить выгрузку %s: %s", path, e)
+
+export_jobs = ExportJobManager()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import MEDIA_GC_INTERVAL, MEDIA_GC_GRACE
+from database.db import get_orphan_blobs, delete_orphan_blob, register_media_blob
+from database.fsm_storage import SQLiteStorage
+from utils.downloads import downloads
+
+async def session_media_paths(storage: BaseStorage | None) -> set[str]:
+    """Пути медиа в незавершённых FSM-сессиях (ещё не подтверждённые обращения)"""
+    paths: set[str] = set()
+    if isinstance(storage, SQLiteStorage):
+        records = await storage.all_data()
+    elif isinstance(storage, MemoryStorage):
+        records = [record.data for record in storage.storage.values()]
+    else:
+        return paths
+    for data in records:
+        for media in data.get('media_files', []):
+            paths.add(media['path'])
+    return paths
+
+class MediaGarbageCollector:
+    """Периодически удаляет скачанные файлы, на которые так и не сослалась media.
+
+    Кандидаты берутся из media_blobs по индексу (refs = 0, старше grace),
+    без обхода MEDIA_DIR. Файлы живых FSM-сессий, текущих загрузок и запрошенные
+    через downloads.enqueue за последние grace секунд не трогаются.
+    """
+
+    def __init__(self, interval: float = MEDIA_GC_INTERVAL, grace: float = MEDIA_GC_GRACE):
+        self.interval = interval
+        self.grace = grace
+        self.storage: BaseStorage | None = None
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self, storage: BaseStorage):
+        self.storage = storage
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep_once()
+            except Exception:
+                logging.exception("Ошибка сборщика медиа")
+
+    async def sweep_once(self) -> tuple[int, int]:
+        """Один проход; вернуть (удалено файлов, освобождено байт)"""
+        deadline = time.time() - self.grace
+        downloads.prune_claims(deadline)
+        live = await session_media_paths(self.storage)
+        files = 0
+        freed = 0
+        after = (0.0, '')
+        while True:
+            orphans = await get_orphan_blobs(deadline, after)
+            if not orphans:
+                break
+            for file_unique_id, path, size, _ in orphans:
+                if path in live or downloads.in_use(path, deadline) or not await delete_orphan_blob(file_unique_id):
+                    continue
+                # Пока шло удаление записи, файл могла взять новая сессия (enqueue не качает
+                # уже лежащий файл). Проверка и удаление ниже идут без await — атомарно для цикла
+                if downloads.in_use(path, deadline):
+                    await register_media_blob(file_unique_id, path, size)
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    size = 0
+                except OSError:
+                    # Файл остался на диске — возвращаем запись, чтобы попробовать в следующий раз
+                    logging.exception("Сборщик медиа: не удалось удалить %s", path)
+                    await register_media_blob(file_unique_id, path, size)
+                    continue
+                files += 1
+                freed += size or 0
+            last = orphans[-1]
+            after = (last[3], last[0])
+        self.reclaimed_files += files
+        self.reclaimed_bytes += freed
+        if files:
+            logging.info("Сборщик медиа: удалено %s файлов, освобождено %s байт", files, freed)
+        return files, freed
+
+media_gc = MediaGarbageCollector()
@@ -0,0 +1,161 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable
+from aiohttp import web
+
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = labels + (extra,) if extra else labels
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (формат Prometheus)"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+class MetricsRegistry:
+    """Счётчики и гистограммы в памяти процесса, вывод в текстовом формате Prometheus.
+
+    Метрики создаются при первом обращении: inc('name', {'label': ...}),
+    observe('name', seconds, {...}). Значения, которые удобнее читать
+    в момент выгрузки (глубина очередей, размер кэшей), отдают коллекторы.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.help: dict[str, str] = {}
+        self._collectors: list[Callable[[], dict[str, float]]] = []
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, labels: dict[str, str] | None = None, value: float = 1):
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels or {})
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict[str, str] | None = None):
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels or {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, labels: dict[str, str] | None = None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    def collector(self, func: Callable[[], dict[str, float]]):
+        """Зарегистрировать функцию, возвращающую {имя_метрики: значение}"""
+        self._collectors.append(func)
+        return func
+
+    def collect(self) -> dict[str, float]:
+        gauges = {}
+        for func in self._collectors:
+            try:
+                gauges.update(func())
+            except Exception:
+                logging.exception("Ошибка коллектора метрик")
+        return gauges
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, value in sorted(self.collect().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def top(self, name: str, label: str, limit: int = 10) -> list[tuple[str, Histogram]]:
+        """Серии гистограммы с наибольшим суммарным временем"""
+        series = self.histograms.get(name, {})
+        ranked = sorted(series.items(), key=lambda item: item[1].sum, reverse=True)[:limit]
+        return [(dict(labels).get(label, ""), histogram) for labels, histogram in ranked]
+
+metrics = MetricsRegistry()
+metrics.describe("bot_handler_seconds", "Время работы хендлера")
+metrics.describe("bot_db_query_seconds", "Время выполнения SQL-выражения")
+metrics.describe("bot_telegram_request_seconds", "Время запроса к Telegram Bot API")
+metrics.describe("bot_telegram_errors_total", "Ошибки запросов к Telegram Bot API")
+metrics.describe("bot_handler_errors_total", "Исключения в хендлерах")
+metrics.describe("bot_event_loop_lag_seconds", "Задержка цикла событий (во время профилирования)")
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner | None:
+    """Локальный HTTP-эндпоинт /metrics для Prometheus; None, если порт занят (бот работает и без него)"""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError as e:
+        logging.warning("Эндпоинт метрик %s:%s не запущен: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logging.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
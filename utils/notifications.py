@@ -1,15 +1,8 @@
+import asyncio
 from aiogram import Bot
 from config import ADMIN_IDS
+from utils.broadcast import BroadcastResult, broadcast_in_background
 
-async def notify_admins(bot: Bot, message: str):
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, message)
-        except Exception as e:
-            print(f"❌ Ошибка уведомления админа {admin_id}: {e}")
-
-async def notify_user(bot: Bot, user_id: int, message: str):
-    try:
-        await bot.send_message(user_id, message)
-    except Exception as e:
-        print(f"❌ Ошибка уведомления пользователя {user_id}: {e}")
\ No newline at end of file
+def notify_admins(bot: Bot, message: str) -> asyncio.Task[BroadcastResult]:
+    """Уведомить админов в фоне; результат (доставлено/ошибок) — в задаче"""
+    return broadcast_in_background(bot, ADMIN_IDS, message)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from config import OUTBOX_BATCH_SIZE, OUTBOX_CONCURRENCY, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE, OUTBOX_POLL_INTERVAL
+from database.db import fetch_outbox_batch, complete_outbox
+from utils.broadcast import send_message
+from utils.metrics import metrics
+
+MAX_RETRY_DELAY = 3600
+
+class OutboxWorker:
+    """Фоновая доставка уведомлений из таблицы outbox.
+
+    Забирает пачку, отправляет параллельно (с лимитами Telegram),
+    доставленные удаляет, остальные откладывает с экспоненциальной паузой.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, concurrency: int = OUTBOX_CONCURRENCY,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, retry_base: float = OUTBOX_RETRY_BASE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.delivered = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Сообщить воркеру о новых записях, не дожидаясь опроса"""
+        self._wakeup.set()
+
+    async def _run(self, bot: Bot):
+        while True:
+            try:
+                delivered = await self.drain_once(bot)
+            except Exception:
+                logging.exception("Ошибка воркера outbox")
+                delivered = 0
+            if delivered < self.batch_size:
+                # Очередь пуста — ждём сигнала или следующего опроса
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def drain_once(self, bot: Bot) -> int:
+        """Обработать одну пачку; вернуть её размер"""
+        batch = await fetch_outbox_batch(self.batch_size)
+        if not batch:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sent_ids: list[int] = []
+        retries: list[tuple[int, float | None, str]] = []
+
+        async def deliver(outbox_id: int, chat_id: int, text: str, attempts: int):
+            async with semaphore:
+                try:
+                    await send_message(bot, chat_id, text)
+                    sent_ids.append(outbox_id)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    # Бот заблокирован / чат не существует — повтор не поможет
+                    retries.append((outbox_id, None, str(e)))
+                except Exception as e:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        retries.append((outbox_id, None, str(e)))
+                    else:
+                        delay = min(self.retry_base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+                        retries.append((outbox_id, time.time() + delay, str(e)))
+
+        await asyncio.gather(*(deliver(*item) for item in batch))
+        await complete_outbox(sent_ids, retries)
+        self.delivered += len(sent_ids)
+        self.failed += sum(1 for _, next_at, _ in retries if next_at is None)
+        if retries:
+            logging.warning("Outbox: доставлено %s, отложено/ошибок %s", len(sent_ids), len(retries))
+        return len(batch)
+
+outbox = OutboxWorker()
+metrics.collector(lambda: {"bot_outbox_delivered": outbox.delivered, "bot_outbox_failed": outbox.failed})
@@ -0,0 +1,13 @@
+import re
+
+# Курсор keyset-пагинации (created_at, id), упакованный для callback_data:
+# "2025-10-20 20:28:53", 17 -> "20251020202853.17"
+
+def encode_cursor(created_at: str, appeal_id: int) -> str:
+    digits = re.sub(r'\D', '', created_at)
+    return f"{digits}.{appeal_id}"
+
+def decode_cursor(value: str) -> tuple[str, int]:
+    digits, appeal_id = value.split(".")
+    created_at = f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}:{digits[12:14]}"
+    return created_at, int(appeal_id)
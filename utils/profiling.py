@@ -0,0 +1,129 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from config import PROFILES_DIR, PROFILE_LAG_INTERVAL, PROFILE_SLOW_CALLBACK
+from utils.metrics import metrics
+
+class SlowCallbackHandler(logging.Handler):
+    """Собирает предупреждения asyncio "Executing <Handle ...> took N seconds" (режим отладки цикла)"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records: list[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if message.startswith("Executing "):
+            self.records.append(message)
+
+@dataclass
+class ProfileReport:
+    seconds: float
+    stats_path: str
+    report_path: str
+    lag_max: float = 0.0
+    lag_avg: float = 0.0
+    slow_callbacks: list[str] = field(default_factory=list)
+
+class LoopProfiler:
+    """Профилирование работающего процесса по запросу (/profile или PROFILE_ON_START).
+
+    На время сессии включаются cProfile (весь код в потоке цикла событий),
+    замер задержки цикла и режим отладки asyncio, который сообщает
+    о колбэках дольше slow_callback секунд. Результат — дамп pstats
+    и текстовый отчёт в PROFILES_DIR. Одновременно идёт одна сессия.
+    Код в потоках (aiosqlite, выгрузки в to_thread) cProfile не видит —
+    его время видно по задержкам await в отчёте.
+    """
+
+    def __init__(self, profiles_dir: str = PROFILES_DIR, lag_interval: float = PROFILE_LAG_INTERVAL,
+                 slow_callback: float = PROFILE_SLOW_CALLBACK):
+        self.profiles_dir = profiles_dir
+        self.lag_interval = lag_interval
+        self.slow_callback = slow_callback
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def _measure_lag(self, samples: list[float]):
+        while True:
+            expected = time.perf_counter() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            samples.append(lag)
+            metrics.observe("bot_event_loop_lag_seconds", lag)
+
+    async def profile(self, seconds: float) -> ProfileReport:
+        if self.running:
+            raise RuntimeError("Профилирование уже запущено")
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            debug, slow_duration = loop.get_debug(), loop.slow_callback_duration
+            slow_handler = SlowCallbackHandler()
+            asyncio_logger = logging.getLogger("asyncio")
+            samples: list[float] = []
+
+            asyncio_logger.addHandler(slow_handler)
+            loop.slow_callback_duration = self.slow_callback
+            loop.set_debug(True)
+            lag_task = asyncio.create_task(self._measure_lag(samples))
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+                lag_task.cancel()
+                loop.set_debug(debug)
+                loop.slow_callback_duration = slow_duration
+                asyncio_logger.removeHandler(slow_handler)
+
+            report = ProfileReport(
+                seconds=seconds,
+                stats_path="",
+                report_path="",
+                lag_max=max(samples, default=0.0),
+                lag_avg=sum(samples) / len(samples) if samples else 0.0,
+                slow_callbacks=slow_handler.records,
+            )
+            await asyncio.to_thread(self._save, profiler, report)
+            return report
+
+    def _save(self, profiler: cProfile.Profile, report: ProfileReport):
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        name = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        report.stats_path = os.path.join(self.profiles_dir, name + ".pstats")
+        report.report_path = os.path.join(self.profiles_dir, name + ".txt")
+        profiler.dump_stats(report.stats_path)
+
+        buffer = io.StringIO()
+        buffer.write(f"Длительность: {report.seconds} с\n")
+        buffer.write(f"Задержка цикла событий: макс {report.lag_max * 1000:.1f} мс, "
+                     f"средняя {report.lag_avg * 1000:.1f} мс\n")
+        buffer.write(f"Медленные колбэки (> {self.slow_callback} с): {len(report.slow_callbacks)}\n")
+        for line in report.slow_callbacks[:100]:
+            buffer.write(f"  {line}\n")
+        buffer.write("\n")
+        stats = pstats.Stats(profiler, stream=buffer)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(60)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(30)
+        with open(report.report_path, "w", encoding="utf-8") as f:
+            f.write(buffer.getvalue())
+
+profiler = LoopProfiler()
+
+async def profile_on_start(seconds: float):
+    """Сессия профилирования при запуске (PROFILE_ON_START), результат — в лог и PROFILES_DIR"""
+    try:
+        report = await profiler.profile(seconds)
+        logging.info("Профиль запуска сохранён: %s, %s", report.report_path, report.stats_path)
+    except Exception:
+        logging.exception("Ошибка профилирования при запуске")
@@ -1,129 +1,129 @@
+import asyncio
 import os
+import sqlite3
+import uuid
 from datetime import datetime
-from typing import Dict, List, Any
-import aiosqlite
+from typing import Dict, Iterator, Any
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
-from config import EXPORTS_DIR
-from database.db import DB_FILE
-
-async def get_all_appeals() -> List[Dict[str, Any]]:
-    """Получить все обращения с медиа"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("""
-            SELECT a.id, a.user_id, a.phone, a.full_name, a.address, a.domkom,
-                   a.text, a.created_at, a.status, a.comment,
-                   GROUP_CONCAT(m.file_path || ':' || m.file_type, ';') as media
-            FROM appeals a
-            LEFT JOIN media m ON a.id = m.appeal_id
-            GROUP BY a.id
-            ORDER BY a.created_at DESC
-        """)
-        rows = await cursor.fetchall()
-
-        appeals = []
+from openpyxl.utils import get_column_letter
+from config import EXPORTS_DIR, EXPORT_CHUNK_SIZE, ARCHIVE_DB_FILE
+from database.db import get_counters, DB_FILE
+
+# Колонки выгрузки обращений: (заголовок, SQL-выражение для оценки ширины)
+APPEAL_COLUMNS = [
+    ("ID", "a.id"),
+    ("Foydalanuvchi", "a.user_id"),
+    ("Telefon", "a.phone"),
+    ("F.I.O.", "a.full_name"),
+    ("Manzil", "a.address"),
+    ("Uy MFI/OFI", "a.domkom"),
+    ("Murojaat matni", "a.text"),
+    ("Yaratilgan sana", "a.created_at"),
+    ("Status", "'Ishlanmagan'"),
+    ("Izoh", "a.comment"),
+    ("Media soni", "'000'"),
+    ("Media turlari", "'Rasm, Video'"),
+]
+
+MEDIA_TYPES_UZ = {'photo': 'Rasm', 'video': 'Video'}
+MAX_COLUMN_WIDTH = 50
+
+def iter_appeal_rows(conn: sqlite3.Connection, chunk_size: int = EXPORT_CHUNK_SIZE, schema: str = "main") -> Iterator[list]:
+    """Потоково отдать строки листа обращений, читая базу порциями (schema='archive' — архив)"""
+    # Порядок по id совпадает с порядком created_at и не требует сортировки
+    cursor = conn.execute(f"""
+        SELECT a.id, a.user_id, a.phone, a.full_name, a.address, a.domkom,
+               a.text, a.created_at, a.status, a.comment,
+               (SELECT COUNT(*) FROM {schema}.media m WHERE m.appeal_id = a.id),
+               (SELECT GROUP_CONCAT(DISTINCT m.file_type) FROM {schema}.media m WHERE m.appeal_id = a.id)
+        FROM {schema}.appeals a
+        ORDER BY a.id DESC
+    """)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
         for row in rows:
-            appeal = {
-                'id': row[0],
-                'user_id': row[1],
-                'phone': row[2],
-                'full_name': row[3],
-                'address': row[4],
-                'domkom': row[5],
-                'text': row[6],
-                'created_at': row[7],
-                'status': row[8],
-                'comment': row[9] or '',
-                'media_count': 0,
-                'media_types': []
-            }
-
-            if row[10]:  # media
-                media_items = row[10].split(';')
-                appeal['media_count'] = len(media_items)
-                appeal['media_types'] = list(set(item.split(':')[1] for item in media_items if ':' in item))
-
-            appeals.append(appeal)
-
-        return appeals
+            status_uz = "Ishlangan" if row[8] == "processed" else "Ishlanmagan"
+            media_types = row[11].split(',') if row[11] else []
+            media_types_uz = ', '.join(MEDIA_TYPES_UZ.get(mt, mt) for mt in media_types)
+            yield [row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7],
+                   status_uz, row[9] or '', row[10], media_types_uz]
+
+def get_appeal_column_widths(conn: sqlite3.Connection, schema: str = "main") -> list[int]:
+    """Ширины колонок одним агрегирующим запросом.
+
+    В write-only режиме ширины нужно задать до первой строки,
+    поэтому максимум длины считает SQLite, а не второй проход по ячейкам.
+    """
+    select = ", ".join(f"MAX(LENGTH(CAST({expr} AS TEXT)))" for _, expr in APPEAL_COLUMNS)
+    row = conn.execute(f"SELECT {select} FROM {schema}.appeals a").fetchone()
+    return [
+        min(max(len(header), length or 0) + 2, MAX_COLUMN_WIDTH)
+        for (header, _), length in zip(APPEAL_COLUMNS, row)
+    ]
 
 async def get_users_stats() -> Dict[str, Any]:
     """Получить статистику пользователей"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        # Общее количество пользователей
-        cursor = await db.execute("SELECT COUNT(*) FROM users")
-        result = await cursor.fetchone()
-        total_users = result[0] if result else 0
-
-        # Количество админов
-        cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-        result = await cursor.fetchone()
-        admin_count = result[0] if result else 0
-
-        # Количество обычных пользователей
-        user_count = total_users - admin_count
-
-        return {
-            'total_users': total_users,
-            'admin_count': admin_count,
-            'user_count': user_count
-        }
-
-async def get_appeals_stats() -> Dict[str, Any]:
-    """Получить статистику обращений"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        # Общее количество обращений
-        cursor = await db.execute("SELECT COUNT(*) FROM appeals")
-        result = await cursor.fetchone()
-        total_appeals = result[0] if result else 0
-
-        # Количество обработанных
-        cursor = await db.execute("SELECT COUNT(*) FROM appeals WHERE status = 'processed'")
-        result = await cursor.fetchone()
-        processed_count = result[0] if result else 0
-
-        # Количество необработанных
-        unprocessed_count = total_appeals - processed_count
-
-        # Статистика по медиа
-        cursor = await db.execute("SELECT COUNT(*) FROM media")
-        result = await cursor.fetchone()
-        total_media = result[0] if result else 0
-
-        cursor = await db.execute("SELECT file_type, COUNT(*) FROM media GROUP BY file_type")
-        rows = await cursor.fetchall()
-        media_types = {row[0]: row[1] for row in rows}
-
-        return {
-            'total_appeals': total_appeals,
-            'processed_count': processed_count,
-            'unprocessed_count': unprocessed_count,
-            'total_media': total_media,
-            'media_types': media_types
-        }
-
-async def create_excel_export_async() -> str:
-    """Создать Excel файл с полной статистикой (асинхронная версия)"""
-    # Получить данные асинхронно
-    appeals = await get_all_appeals()
-    users_stats = await get_users_stats()
-    appeals_stats = await get_appeals_stats()
-
-    # Создать workbook
-    wb = Workbook()
-    ws_stats = wb.active
-    if ws_stats is None:
-        raise ValueError("Не удалось создать лист статистики")
-    ws_stats.title = "Статистика"
-
-    # Заголовки
-    headers = ["Ko'rsatkich", "Qiymat"]
-    for col, header in enumerate(headers, 1):
-        cell = ws_stats.cell(row=1, column=col, value=header)
+    counters = await get_counters('users')
+    total_users = counters.get('users', 0)
+    admin_count = counters.get('users:admin', 0)
+
+    return {
+        'total_users': total_users,
+        'admin_count': admin_count,
+        'user_count': total_users - admin_count
+    }
+
+async def get_appeals_stats(include_archive: bool = False) -> Dict[str, Any]:
+    """Получить статистику обращений (с include_archive — вместе с архивом)"""
+    counters = await get_counters()
+    if include_archive:
+        for name, value in (await get_counters(schema='archive')).items():
+            counters[name] = counters.get(name, 0) + value
+    total_appeals = counters.get('appeals', 0)
+    processed_count = counters.get('appeals:processed', 0)
+
+    media_types = {
+        name.split(':', 1)[1]: value
+        for name, value in counters.items()
+        if name.startswith('media:') and value
+    }
+
+    return {
+        'total_appeals': total_appeals,
+        'processed_count': processed_count,
+        'unprocessed_count': total_appeals - processed_count,
+        'total_media': counters.get('media', 0),
+        'media_types': media_types
+    }
+
+def _header_cells(ws, headers: list[str]) -> list[WriteOnlyCell]:
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
         cell.font = Font(bold=True)
         cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-
-    # Данные статистики
+        cells.append(cell)
+    return cells
+
+def _write_appeals_sheet(wb: Workbook, title: str, conn: sqlite3.Connection, schema: str):
+    ws = wb.create_sheet(title)
+    for col_num, width in enumerate(get_appeal_column_widths(conn, schema), 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+    ws.append(_header_cells(ws, [header for header, _ in APPEAL_COLUMNS]))
+    for row in iter_appeal_rows(conn, schema=schema):
+        ws.append(row)
+
+def build_excel_export(filepath: str, users_stats: Dict[str, Any], appeals_stats: Dict[str, Any],
+                       include_archive: bool = False) -> str:
+    """Собрать xlsx в write-only режиме (синхронно, вызывается в отдельном потоке)"""
+    wb = Workbook(write_only=True)
+
+    # Лист статистики
+    ws_stats = wb.create_sheet("Статистика")
     stats_data = [
         ["Jami foydalanuvchilar", users_stats['total_users']],
         ["Administratorlar", users_stats['admin_count']],
@@ -135,91 +135,45 @@ async def create_excel_export_async() -> str:
         ["", ""],
         ["Jami media fayllar", appeals_stats['total_media']],
     ]
-
-    # Добавить типы медиа
     for media_type, count in appeals_stats['media_types'].items():
-        media_type_uz = "Rasm" if media_type == "photo" else "Video" if media_type == "video" else media_type
-        stats_data.append([f"{media_type_uz} turi", count])
-
-    for row, (label, value) in enumerate(stats_data, 2):
-        ws_stats.cell(row=row, column=1, value=label)
-        ws_stats.cell(row=row, column=2, value=value)
-
-    # Автоподгонка ширины колонок
-    from openpyxl.utils import get_column_letter
-    for col_num, column in enumerate(ws_stats.columns, 1):
-        max_length = 0
-        for cell in column:
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        if max_length > 0:
-            adjusted_width = min(max_length + 2, 50)
-            ws_stats.column_dimensions[get_column_letter(col_num)].width = adjusted_width
-
-    # Лист обращений
-    ws_appeals = wb.create_sheet("Murojaatlar")
-
-    # Заголовки для обращений
-    appeal_headers = ["ID", "Foydalanuvchi", "Telefon", "F.I.O.", "Manzil", "Uy MFI/OFI",
-                     "Murojaat matni", "Yaratilgan sana", "Status", "Izoh",
-                     "Media soni", "Media turlari"]
-
-    for col, header in enumerate(appeal_headers, 1):
-        cell = ws_appeals.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+        stats_data.append([f"{MEDIA_TYPES_UZ.get(media_type, media_type)} turi", count])
 
-    # Данные обращений
-    for row, appeal in enumerate(appeals, 2):
-        ws_appeals.cell(row=row, column=1, value=appeal['id'])
-        ws_appeals.cell(row=row, column=2, value=appeal['user_id'])
-        ws_appeals.cell(row=row, column=3, value=appeal['phone'])
-        ws_appeals.cell(row=row, column=4, value=appeal['full_name'])
-        ws_appeals.cell(row=row, column=5, value=appeal['address'])
-        ws_appeals.cell(row=row, column=6, value=appeal['domkom'])
-        ws_appeals.cell(row=row, column=7, value=appeal['text'])
-        ws_appeals.cell(row=row, column=8, value=appeal['created_at'])
-        status_uz = "Ishlangan" if appeal['status'] == "processed" else "Ishlanmagan"
-        ws_appeals.cell(row=row, column=9, value=status_uz)
-        ws_appeals.cell(row=row, column=10, value=appeal['comment'])
-        ws_appeals.cell(row=row, column=11, value=appeal['media_count'])
-        media_types_uz = []
-        for mt in appeal['media_types']:
-            if mt == 'photo':
-                media_types_uz.append('Rasm')
-            elif mt == 'video':
-                media_types_uz.append('Video')
-            else:
-                media_types_uz.append(mt)
-        ws_appeals.cell(row=row, column=12, value=', '.join(media_types_uz))
-
-    # Автоподгонка ширины колонок для обращений
-    for col_num, column in enumerate(ws_appeals.columns, 1):
-        max_length = 0
-        for cell in column:
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        if max_length > 0:
-            adjusted_width = min(max_length + 2, 50)  # Ограничить максимальную ширину
-            ws_appeals.column_dimensions[get_column_letter(col_num)].width = adjusted_width
-
-    # Сгенерировать имя файла с timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"statistics_{timestamp}.xlsx"
-    filepath = os.path.join(EXPORTS_DIR, filename)
+    headers = ["Ko'rsatkich", "Qiymat"]
+    for col_num in range(len(headers)):
+        max_length = max(len(str(row[col_num])) for row in [headers] + stats_data)
+        ws_stats.column_dimensions[get_column_letter(col_num + 1)].width = min(max_length + 2, MAX_COLUMN_WIDTH)
+    ws_stats.append(_header_cells(ws_stats, headers))
+    for row in stats_data:
+        ws_stats.append(row)
+
+    # Листы обращений: строки идут из базы потоком, память не растёт
+    conn = sqlite3.connect(f"file:{os.path.abspath(DB_FILE)}?mode=ro", uri=True)
+    try:
+        _write_appeals_sheet(wb, "Murojaatlar", conn, "main")
+        if include_archive:
+            conn.execute("ATTACH DATABASE ? AS archive", (f"file:{os.path.abspath(ARCHIVE_DB_FILE)}?mode=ro",))
+            _write_appeals_sheet(wb, "Arxiv", conn, "archive")
+    finally:
+        conn.close()
 
-    # Сохранить файл
     wb.save(filepath)
-
     return filepath
 
-def create_excel_export() -> str:
+async def create_excel_export_async(include_archive: bool = False) -> str:
+    """Создать Excel файл с полной статистикой (асинхронная версия)"""
+    users_stats = await get_users_stats()
+    appeals_stats = await get_appeals_stats(include_archive)
+
+    # Имя с видом выгрузки и уникальным суффиксом: задачи /export и /export arxiv
+    # могут стартовать в одну секунду и не должны писать в один файл
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    kind = "_arxiv" if include_archive else ""
+    filename = f"statistics{kind}_{timestamp}_{uuid.uuid4().hex[:8]}.xlsx"
+    filepath = os.path.join(EXPORTS_DIR, filename)
+
+    # Сборка книги — CPU-работа, уводим её с event loop
+    return await asyncio.to_thread(build_excel_export, filepath, users_stats, appeals_stats, include_archive)
+
+def create_excel_export(include_archive: bool = False) -> str:
     """Создать Excel файл с полной статистикой (синхронная обертка)"""
-    import asyncio
-    return asyncio.run(create_excel_export_async())
\ No newline at end of file
+    return asyncio.run(create_excel_export_async(include_archive))
\ No newline at end of file
@@ -10,4 +10,15 @@ def validate_phone_clean(phone: str) -> bool:
     return bool(re.match(pattern, phone))
 
 def clean_phone(phone: str) -> str:
-    return re.sub(r'\D', '', phone)
\ No newline at end of file
+    return re.sub(r'\D', '', phone)
+
+def normalize_phone(phone: str) -> str:
+    """Номер для поиска: только цифры с кодом страны (901234567 -> 998901234567)"""
+    digits = clean_phone(phone)
+    if len(digits) == 9:
+        digits = "998" + digits
+    return digits
+
+def parse_id(text: str) -> int | None:
+    """Номер обращения или Telegram ID из ввода: только ASCII-цифры, не больше 18 (влезает в INTEGER SQLite)"""
+    return int(text) if re.fullmatch(r'[0-9]{1,18}', text) else None
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import logging
+from typing import Any
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+                    WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_REPLY_TIMEOUT)
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook с пределом одновременных апдейтов.
+
+    Если хендлер успевает за reply_timeout и возвращает метод API
+    (например, `return message.answer(...)`), ответ уходит прямо в теле
+    ответа на webhook — без отдельного запроса к Telegram. Медленные
+    хендлеры дорабатывают в фоне, а их метод отправляется отдельным запросом.
+    Слот занят до конца хендлера, а не до ответа на webhook, поэтому
+    max_concurrency ограничивает и фоновые хендлеры.
+
+    Переопределяет _handle_request aiogram — версия закреплена в requirements.txt.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+                 reply_timeout: float = WEBHOOK_REPLY_TIMEOUT, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, **kwargs)
+        self.reply_timeout = reply_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data))
+        task.add_done_callback(lambda _: self._semaphore.release())
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.reply_timeout)
+        except BaseException:
+            task.add_done_callback(functools.partial(self._finish_late, bot))
+            raise
+        if not done:
+            task.add_done_callback(functools.partial(self._finish_late, bot))
+            return web.Response(body=self._build_response_writer(bot=bot, result=None))
+        result = task.result()
+        return web.Response(body=self._build_response_writer(
+            bot=bot, result=result if isinstance(result, TelegramMethod) else None))
+
+    def _finish_late(self, bot: Bot, task: asyncio.Task):
+        """Хендлер закончил после ответа на webhook: его метод — отдельным запросом"""
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logging.error("Ошибка фонового хендлера webhook", exc_info=task.exception())
+            return
+        if isinstance(task.result(), TelegramMethod):
+            send = asyncio.create_task(self.dispatcher.silent_call_request(bot=bot, result=task.result()))
+            self._background_feed_update_tasks.add(send)
+            send.add_done_callback(self._background_feed_update_tasks.discard)
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Поднять aiohttp-сервер для webhook (за локальным reverse proxy)"""
+    # Без секрета SimpleRequestHandler принимает любой POST — поддельные апдейты от имени админа
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан: в webhook-режиме он обязателен")
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    app = web.Application()
+    LimitedRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+    logging.info("Webhook слушает %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()